@@ -0,0 +1,70 @@
+import pathlib
+import threading
+import time
+from typing import Union
+
+from PIL import Image
+
+
+class CascadeOCR:
+    """Recognize with the cheapest tier first and escalate unsure answers.
+
+    ``tiers`` are ``(name, recognizer)`` pairs ordered from fast to accurate.
+    An answer is accepted when its sequence confidence reaches the tier's
+    threshold, otherwise the next tier tries; the last tier always answers
+    and may be any object with ``get_text`` (e.g. the ddddocr model).
+    ``thresholds`` is one value for every tier but the last, or a list.
+    """
+
+    def __init__(self, tiers: list, thresholds: Union[float, list] = 0.9):
+        if not tiers:
+            raise ValueError("at least one tier is required")
+        if isinstance(thresholds, (int, float)):
+            thresholds = [thresholds] * (len(tiers) - 1)
+        if len(thresholds) != len(tiers) - 1:
+            raise ValueError(f"{len(tiers)} tiers need {len(tiers) - 1} thresholds, got {len(thresholds)}")
+        for name, recognizer in tiers[:-1]:
+            if not hasattr(recognizer, 'get_text_with_confidence'):
+                raise TypeError(f"tier {name} cannot escalate: it has no get_text_with_confidence")
+        self.tiers = tiers
+        self.thresholds = list(thresholds)
+        self._calls = {name: 0 for name, _ in tiers}
+        self._accepted = {name: 0 for name, _ in tiers}
+        self._seconds = {name: 0.0 for name, _ in tiers}
+        self._lock = threading.Lock()
+
+    def get_text_with_confidence(self, img: Union[bytes, str, pathlib.PurePath, Image.Image]) -> dict:
+        for index, (name, recognizer) in enumerate(self.tiers):
+            start = time.perf_counter()
+            if hasattr(recognizer, 'get_text_with_confidence'):
+                result = dict(recognizer.get_text_with_confidence(img))
+            else:
+                result = {'text': recognizer.get_text(img), 'confidence': None}
+            elapsed = time.perf_counter() - start
+            accepted = index == len(self.tiers) - 1 or result['confidence'] >= self.thresholds[index]
+            with self._lock:
+                self._calls[name] += 1
+                self._accepted[name] += accepted
+                self._seconds[name] += elapsed
+            if accepted:
+                result['tier'] = name
+                return result
+
+    def get_text(self, img: Union[bytes, str, pathlib.PurePath, Image.Image]) -> str:
+        return self.get_text_with_confidence(img)['text']
+
+    def stats(self) -> dict:
+        """Per tier: images it saw, answers it gave, its share of all answers and its mean latency."""
+        with self._lock:
+            total = self._calls[self.tiers[0][0]]
+            tiers = {
+                name: {
+                    'calls': self._calls[name],
+                    'accepted': self._accepted[name],
+                    'hit_rate': self._accepted[name] / total if total else 0.0,
+                    'mean_ms': self._seconds[name] / self._calls[name] * 1000 if self._calls[name] else 0.0,
+                }
+                for name, _ in self.tiers
+            }
+            seconds = sum(self._seconds.values())
+        return {'images': total, 'mean_ms': seconds / total * 1000 if total else 0.0, 'tiers': tiers}
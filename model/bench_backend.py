@@ -0,0 +1,65 @@
+import argparse
+import os
+import pathlib
+import time
+
+import numpy as np
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../build_dataset/NJUlogin'))
+from captchaOCR import CaptchaOCR
+
+
+def benchmark(ocr, images, rounds):
+    ocr.run(images)
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        ocr.run(images)
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the onnxruntime and NumPy backends of CaptchaOCR')
+    parser.add_argument('--model', type=str, default=None, help='ONNX model to run (default: the one shipped with captchaOCR)')
+    parser.add_argument('--image_dir', type=str, default=None, help='Dataset directory; also compares accuracy on its test split')
+    parser.add_argument('--batch_sizes', type=str, default='1,8,32,64', help='Comma separated batch sizes to time')
+    parser.add_argument('--rounds', type=int, default=50, help='Timed runs per batch size')
+    parser.add_argument('--limit', type=int, default=0, help='Use at most this many test images (0: all)')
+    args = parser.parse_args()
+
+    sample = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../service/captcha.jpg')
+    ocrs = {backend: CaptchaOCR(import_onnx_path=args.model, backend=backend) for backend in ('onnxruntime', 'numpy')}
+    print(f"Model: {ocrs['numpy'].import_onnx_path}")
+
+    image = ocrs['numpy'].preprocess(pathlib.Path(sample))
+    print(f"\n{'batch':>5} {'onnxruntime ms':>15} {'numpy ms':>10} {'ratio':>6}")
+    for size in map(int, args.batch_sizes.split(',')):
+        images = np.repeat(image[np.newaxis], size, axis=0)
+        medians = {backend: np.median(benchmark(ocr, images, args.rounds)) for backend, ocr in ocrs.items()}
+        print(f"{size:>5} {medians['onnxruntime']:>15.2f} {medians['numpy']:>10.2f} "
+              f"{medians['numpy'] / medians['onnxruntime']:>6.2f}")
+
+    images = np.repeat(image[np.newaxis], 8, axis=0)
+    difference = np.abs(ocrs['onnxruntime'].run(images) - ocrs['numpy'].run(images)).max()
+    print(f"\nMax absolute logit difference: {difference:.2e}")
+
+    if args.image_dir:
+        image_names = sorted(os.listdir(os.path.join(args.image_dir, 'test')))
+        if args.limit:
+            image_names = image_names[:args.limit]
+        paths = [pathlib.Path(args.image_dir, 'test', name) for name in image_names]
+        labels = [name.split('_')[0] for name in image_names]
+        results = {}
+        for backend, ocr in ocrs.items():
+            start = time.perf_counter()
+            results[backend] = ocr.get_texts(paths)
+            elapsed = time.perf_counter() - start
+            accuracy = np.mean([text == label for text, label in zip(results[backend], labels)])
+            print(f"{backend}: accuracy {accuracy:.2%}, {len(paths) / elapsed:.2f} images/sec")
+        agreement = np.mean([a == b for a, b in zip(results['onnxruntime'], results['numpy'])])
+        print(f"Predictions identical in both backends: {agreement:.2%}")
+
+
+if __name__ == '__main__':
+    main()
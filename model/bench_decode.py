@@ -0,0 +1,56 @@
+import argparse
+import os
+import time
+from tqdm import tqdm
+
+import numpy as np
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../build_dataset/NJUlogin'))
+from captchaOCR import CaptchaOCR
+
+
+def benchmark(ocr, images):
+    texts, latencies = [], []
+    for data in tqdm(images, ncols=100):
+        start = time.perf_counter()
+        image = ocr.preprocess(data)
+        latencies.append(time.perf_counter() - start)
+        texts.append(ocr.predict(image[np.newaxis])[0])
+    return texts, np.array(latencies) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare exact and JPEG draft decoding of CaptchaOCR')
+    parser.add_argument('--image_dir', type=str, help='Path to image directory', required=True)
+    parser.add_argument('--split', type=str, default='test', help='Dataset split to use')
+    parser.add_argument('--limit', type=int, default=0, help='Use at most this many images (0: all)')
+    args = parser.parse_args()
+
+    image_names = sorted(os.listdir(os.path.join(args.image_dir, args.split)))
+    if args.limit:
+        image_names = image_names[:args.limit]
+    labels = [name.split('_')[0] for name in image_names]
+    images = []
+    for name in image_names:
+        with open(os.path.join(args.image_dir, args.split, name), 'rb') as f:
+            images.append(f.read())
+    print(f"length of {args.split} images: {len(images)}")
+
+    results = {}
+    for mode, fast_decode in (('exact', False), ('draft', True)):
+        print(f"\nDecoding with {mode} mode...")
+        ocr = CaptchaOCR(fast_decode=fast_decode)
+        ocr.get_text(images[0])
+        texts, latencies = benchmark(ocr, images)
+        results[mode] = texts
+        accuracy = np.mean([text == label for text, label in zip(texts, labels)])
+        print(f"Accuracy: {accuracy:.2%}")
+        print(f"Decode latency: mean {latencies.mean():.1f}us, p50 {np.percentile(latencies, 50):.1f}us, "
+              f"p95 {np.percentile(latencies, 95):.1f}us")
+
+    agreement = np.mean([a == b for a, b in zip(results['exact'], results['draft'])])
+    print(f"\nPredictions identical in both modes: {agreement:.2%}")
+
+
+if __name__ == '__main__':
+    main()
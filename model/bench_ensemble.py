@@ -0,0 +1,71 @@
+import argparse
+import os
+import pathlib
+import tempfile
+import time
+from tqdm import tqdm
+
+import numpy as np
+import onnx
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../build_dataset/NJUlogin'))
+from captchaOCR import CaptchaOCR
+from merge_ensemble import merge_ensemble
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the accuracy gained per millisecond by ensembling checkpoints')
+    parser.add_argument('models', type=str, nargs='+', help='Float ONNX checkpoints, in the order they join the ensemble')
+    parser.add_argument('--image_dir', type=str, help='Path to image directory', required=True)
+    parser.add_argument('--split', type=str, default='test', help='Dataset split to use')
+    parser.add_argument('--limit', type=int, default=0, help='Use at most this many images (0: all)')
+    parser.add_argument('--batch_size', type=int, default=64, help='Images per inference call')
+    args = parser.parse_args()
+
+    image_names = sorted(os.listdir(os.path.join(args.image_dir, args.split)))
+    if args.limit:
+        image_names = image_names[:args.limit]
+    labels = [name.split('_')[0] for name in image_names]
+    paths = [pathlib.Path(args.image_dir, args.split, name) for name in image_names]
+    print(f"length of {args.split} images: {len(paths)}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # every single member, then the ensembles of the first 2, 3, ... members;
+        # train.py names every export nju_captcha.onnx, so members are labelled by position and path
+        singles = [f'member{index}: {path}' for index, path in enumerate(args.models)]
+        configs = dict(zip(singles, args.models))
+        members = [onnx.load(path) for path in args.models]
+        for size in range(2, len(members) + 1):
+            path = os.path.join(tmp_dir, f'ensemble{size}.onnx')
+            onnx.save(merge_ensemble(members[:size]), path)
+            configs[f'ensemble of first {size}'] = path
+        ocrs = {name: CaptchaOCR(import_onnx_path=path) for name, path in configs.items()}
+        preprocessor = next(iter(ocrs.values()))
+        if preprocessor.uint8_input:
+            raise ValueError("pass float checkpoints; the uint8 variants are built from them")
+
+        correct = {name: 0 for name in ocrs}
+        seconds = {name: 0.0 for name in ocrs}
+        # decode and normalize each chunk once, then feed it to every configuration
+        for start in tqdm(range(0, len(paths), args.batch_size), ncols=100):
+            images = np.stack([preprocessor.preprocess(path) for path in paths[start:start + args.batch_size]])
+            chunk_labels = labels[start:start + args.batch_size]
+            for name, ocr in ocrs.items():
+                begin = time.perf_counter()
+                texts = ocr.predict(images)
+                seconds[name] += time.perf_counter() - begin
+                correct[name] += sum(text == label for text, label in zip(texts, chunk_labels))
+
+    accuracy = {name: correct[name] / len(paths) for name in ocrs}
+    ms = {name: seconds[name] / len(paths) * 1000 for name in ocrs}
+    best = max(singles, key=lambda name: accuracy[name])
+    width = max(len(name) for name in ocrs)
+    print(f"\n{'model':<{width}} {'accuracy':>9} {'ms/image':>9} {'gain/ms vs best single':>24}")
+    for name in ocrs:
+        extra_ms = ms[name] - ms[best]
+        gain = f"{(accuracy[name] - accuracy[best]) * 100 / extra_ms:+.3f} pp/ms" if name not in singles and extra_ms > 0 else ''
+        print(f"{name:<{width}} {accuracy[name]:>9.2%} {ms[name]:>9.3f} {gain:>24}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,17 +6,23 @@ import os
 from PIL import Image
 
 class NJUCaptchaDataset(Dataset):
-    def __init__(self, image_paths: str, split: str = 'train', transform: transforms.Compose = None):
+    def __init__(self, image_paths: str, split: str = 'train', transform: transforms.Compose = None, grayscale: bool = False):
         with open(os.path.join(image_paths, 'data.json'), 'r') as f:
             data = json.load(f)
         self.image_paths = image_paths
         self.split = split
+        self.grayscale = grayscale
+        mean, std = data['data_mean'], data['data_std']
+        if grayscale:
+            # the captchas are gray already: the channel statistics are near identical
+            mean, std = [sum(mean) / len(mean)], [sum(std) / len(std)]
+        self.mean, self.std = mean, std
         self.images = os.listdir(os.path.join(image_paths, split))
         self.labels = [img.split('_')[0] for img in self.images]
         self.transform = transform if transform else transforms.Compose([
             transforms.Resize(data['image_shape'][-2:]),
             transforms.ToTensor(),
-            transforms.Normalize(mean=data['data_mean'], std=data['data_std']),
+            transforms.Normalize(mean=mean, std=std),
         ])
         self.tokenizer = data['tokenizer']
         self.mapping = {v: k for k, v in self.tokenizer.items()}
@@ -28,7 +34,7 @@ class NJUCaptchaDataset(Dataset):
         image_path = os.path.join(self.image_paths, self.split, self.images[idx])
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image {image_path} not found.")
-        image = Image.open(image_path).convert('RGB')
+        image = Image.open(image_path).convert('L' if self.grayscale else 'RGB')
 
         if self.transform:
             image = self.transform(image)
@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+DEFAULT_MEAN = [0.743, 0.7432, 0.7431]
+DEFAULT_STD = [0.1917, 0.1918, 0.1917]
+
+
+def fold_preprocess(model: onnx.ModelProto, mean: list, std: list) -> onnx.ModelProto:
+    """Prepend cast, NHWC->NCHW transpose and normalization to a float NCHW model.
+
+    The returned model takes the resized image as a uint8 N×H×W×C tensor, so
+    callers only need to decode and resize.
+    """
+    graph = model.graph
+    old_input = graph.input[0]
+    dims = old_input.type.tensor_type.shape.dim
+    channels, height, width = (dim.dim_value for dim in dims[1:])
+    if len(mean) != channels or len(std) != channels:
+        raise ValueError(f"mean and std need {channels} values, got {len(mean)} and {len(std)}")
+
+    name = old_input.name
+    normalized = name + '_normalized'
+    for node in graph.node:
+        for i, node_input in enumerate(node.input):
+            if node_input == name:
+                node.input[i] = normalized
+
+    scale = 255.0 * np.array(std, dtype=np.float32).reshape(1, channels, 1, 1)
+    offset = 255.0 * np.array(mean, dtype=np.float32).reshape(1, channels, 1, 1)
+    graph.initializer.extend([
+        numpy_helper.from_array(offset, name + '_mean'),
+        numpy_helper.from_array((1.0 / scale).astype(np.float32), name + '_inv_std'),
+    ])
+    nodes = [
+        helper.make_node('Cast', [name], [name + '_float'], to=TensorProto.FLOAT, name='/preprocess/Cast'),
+        helper.make_node('Transpose', [name + '_float'], [name + '_nchw'], perm=[0, 3, 1, 2], name='/preprocess/Transpose'),
+        helper.make_node('Sub', [name + '_nchw', name + '_mean'], [name + '_centered'], name='/preprocess/Sub'),
+        helper.make_node('Mul', [name + '_centered', name + '_inv_std'], [normalized], name='/preprocess/Mul'),
+    ]
+    for i, node in enumerate(nodes):
+        graph.node.insert(i, node)
+
+    batch = dims[0].dim_param or dims[0].dim_value
+    new_input = helper.make_tensor_value_info(name, TensorProto.UINT8, [batch, height, width, channels])
+    graph.input.remove(old_input)
+    graph.input.insert(0, new_input)
+    onnx.checker.check_model(model)
+    return model
+
+
+def load_stats(image_dir: str = None, channels: int = 3) -> tuple:
+    mean, std = DEFAULT_MEAN, DEFAULT_STD
+    if image_dir:
+        with open(os.path.join(image_dir, 'data.json'), 'r') as f:
+            data = json.load(f)
+        mean, std = data['data_mean'], data['data_std']
+    if channels == 1:
+        # grayscale models are normalized with the average of the RGB statistics
+        mean, std = [sum(mean) / len(mean)], [sum(std) / len(std)]
+    return mean, std
+
+
+def input_channels(model: onnx.ModelProto) -> int:
+    return model.graph.input[0].type.tensor_type.shape.dim[1].dim_value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fold uint8 NHWC input handling and normalization into an ONNX model')
+    parser.add_argument('--model', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints', 'nju_captcha.onnx'), help='Float NCHW model to convert')
+    parser.add_argument('--output', type=str, default=None, help='Output path (default: <model>_uint8.onnx)')
+    parser.add_argument('--image_dir', type=str, default=None, help='Dataset directory whose data.json provides mean/std')
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.model)[0] + '_uint8.onnx'
+
+    model = onnx.load(args.model)
+    model = fold_preprocess(model, *load_stats(args.image_dir, input_channels(model)))
+    onnx.save(model, output)
+    print(f"Model with uint8 NHWC input saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import os
+
+import onnx
+from onnx import compose, helper
+
+from fold_preprocess import fold_preprocess, input_channels, load_stats
+
+
+def merge_ensemble(models: list) -> onnx.ModelProto:
+    """Merge checkpoints into one graph that averages their logits.
+
+    All members read the same input tensor, so one ``run`` preprocesses and
+    feeds the batch once and evaluates every member.
+    """
+    if len(models) < 2:
+        raise ValueError("an ensemble needs at least two models")
+    first_input, first_output = models[0].graph.input[0], models[0].graph.output[0]
+    for model in models[1:]:
+        if model.graph.input[0] != first_input:
+            raise ValueError("all members must take the same input (name, type and shape)")
+        if model.graph.output[0].type != first_output.type:
+            raise ValueError("all members must produce outputs of the same type and shape")
+
+    graph = helper.make_graph([], 'nju_captcha_ensemble', [first_input], [first_output])
+    opset = max(
+        opset_import.version
+        for model in models
+        for opset_import in model.opset_import
+        if opset_import.domain in ('', 'ai.onnx')
+    )
+    outputs = []
+    for index, model in enumerate(models):
+        # keep the shared input name, prefix every other name
+        member = compose.add_prefix(model, f'member{index}/', rename_inputs=False)
+        graph.node.extend(member.graph.node)
+        graph.initializer.extend(member.graph.initializer)
+        outputs.append(member.graph.output[0].name)
+    graph.node.append(helper.make_node('Mean', outputs, [first_output.name], name='/ensemble/Mean'))
+
+    merged = helper.make_model(graph, opset_imports=[helper.make_opsetid('', opset)])
+    merged.ir_version = max(model.ir_version for model in models)
+    onnx.checker.check_model(merged)
+    return merged
+
+
+def main():
+    checkpoints = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints')
+    parser = argparse.ArgumentParser(description='Merge several NJU Captcha CNN checkpoints into one ensemble model')
+    parser.add_argument('models', type=str, nargs='+', help='ONNX checkpoints to merge; all must take the same input')
+    parser.add_argument('--output', type=str, default=os.path.join(checkpoints, 'nju_captcha_ensemble.onnx'), help='Output path of the merged model')
+    parser.add_argument('--uint8', action='store_true', help='Fold uint8 NHWC input handling and normalization into the merged float model, once for all members')
+    parser.add_argument('--image_dir', type=str, default=None, help='Dataset directory whose data.json provides mean/std for --uint8')
+    args = parser.parse_args()
+
+    merged = merge_ensemble([onnx.load(path) for path in args.models])
+    if args.uint8:
+        merged = fold_preprocess(merged, *load_stats(args.image_dir, input_channels(merged)))
+    onnx.save(merged, args.output)
+    print(f"Ensemble of {len(args.models)} models saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
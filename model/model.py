@@ -14,7 +14,7 @@ class DepthwiseSeparableConv(nn.Module):
 
 class CaptchaCNN(nn.Module):
     def __init__(self, num_classes: int, captcha_length: int, image_shape: list, channels: list = [16, 32, 48],
-                 conv_dropout: float = 0.1, fc_dropout: float = 0.3):
+                 conv_dropout: float = 0.1, fc_dropout: float = 0.3, in_channels: int = 3):
         super(CaptchaCNN, self).__init__()
         self.num_classes = num_classes
         self.captcha_length = captcha_length
@@ -23,7 +23,7 @@ class CaptchaCNN(nn.Module):
 
         conv_layers = [
             nn.Sequential(
-                nn.Conv2d(3, channels[0], kernel_size=3, stride=2, padding=1),
+                nn.Conv2d(in_channels, channels[0], kernel_size=3, stride=2, padding=1),
                 nn.BatchNorm2d(channels[0]),
                 nn.ReLU(inplace=True),
                 nn.Dropout2d(self.conv_dropout),
@@ -43,7 +43,7 @@ class CaptchaCNN(nn.Module):
 
         self.conv_layers = nn.Sequential(*conv_layers)
 
-        tensor = torch.zeros(1, 3, *image_shape)
+        tensor = torch.zeros(1, in_channels, *image_shape)
         with torch.no_grad():
             # print(f"Input shape: {tensor.shape}")
             output_shape = self.conv_layers(tensor).shape[-2:]
@@ -75,6 +75,20 @@ class CaptchaCNN(nn.Module):
         return torch.stack(outputs, dim=1)
 
 
+class NormalizedInput(nn.Module):
+    # takes uint8 N×H×W×C images so that callers only have to decode and resize
+    def __init__(self, model: nn.Module, mean: list, std: list):
+        super(NormalizedInput, self).__init__()
+        self.model = model
+        self.register_buffer('mean', torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1) * 255)
+        self.register_buffer('inv_std', 1 / (torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1) * 255))
+
+    def forward(self, x):
+        x = x.permute(0, 3, 1, 2).float()
+        x = (x - self.mean) * self.inv_std
+        return self.model(x)
+
+
 if __name__ == "__main__":
     input_shape = (1, 3, 64, 176)
     num_classes, captcha_length = 22, 4
@@ -0,0 +1,88 @@
+import argparse
+import os
+import pathlib
+import random
+import tempfile
+
+import numpy as np
+from onnxruntime.quantization import CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../build_dataset/NJUlogin'))
+from captchaOCR import CaptchaOCR
+
+
+class CaptchaDataReader(CalibrationDataReader):
+    """Feed preprocessed dataset images to the calibrator in small batches."""
+
+    def __init__(self, ocr: CaptchaOCR, image_paths: list, batch_size: int = 32):
+        self.ocr = ocr
+        self.image_paths = image_paths
+        self.batch_size = batch_size
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= len(self.image_paths):
+            return None
+        paths = self.image_paths[self.index:self.index + self.batch_size]
+        self.index += len(paths)
+        images = np.stack([self.ocr.preprocess(pathlib.Path(path)) for path in paths])
+        return {self.ocr.input_name: images}
+
+    def rewind(self):
+        self.index = 0
+
+
+def main():
+    checkpoints = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints')
+    parser = argparse.ArgumentParser(description='Statically quantize the NJU Captcha CNN to INT8')
+    parser.add_argument('--image_dir', type=str, help='Path to image directory', required=True)
+    parser.add_argument('--model', type=str, default=os.path.join(checkpoints, 'nju_captcha.onnx'), help='Float model to quantize')
+    parser.add_argument('--output', type=str, default=os.path.join(checkpoints, 'nju_captcha_int8.onnx'), help='Output path of the quantized model')
+    parser.add_argument('--split', type=str, default='train', help='Dataset split to calibrate on')
+    parser.add_argument('--calib_size', type=int, default=1000, help='Number of calibration images (0: the whole split)')
+    parser.add_argument('--method', type=str, default='minmax', choices=['minmax', 'entropy', 'percentile'], help='Calibration method')
+    parser.add_argument('--format', type=str, default='qdq', choices=['qdq', 'qoperator'], help='Quantized model format')
+    parser.add_argument('--per_channel', action='store_true', help='Quantize conv and gemm weights per output channel')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for picking calibration images')
+    args = parser.parse_args()
+
+    split_dir = os.path.join(args.image_dir, args.split)
+    image_paths = sorted(os.path.join(split_dir, name) for name in os.listdir(split_dir))
+    random.Random(args.seed).shuffle(image_paths)
+    if args.calib_size:
+        image_paths = image_paths[:args.calib_size]
+    print(f"Calibrating on {len(image_paths)} images from {split_dir}")
+
+    ocr = CaptchaOCR(import_onnx_path=args.model)
+    reader = CaptchaDataReader(ocr, image_paths)
+    methods = {
+        'minmax': CalibrationMethod.MinMax,
+        'entropy': CalibrationMethod.Entropy,
+        'percentile': CalibrationMethod.Percentile,
+    }
+    quant_format = QuantFormat.QDQ if args.format == 'qdq' else QuantFormat.QOperator
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # shape inference and graph cleanup make more nodes quantizable
+        prepared = os.path.join(tmp_dir, 'prepared.onnx')
+        quant_pre_process(args.model, prepared, skip_symbolic_shape=True)
+        quantize_static(
+            prepared,
+            args.output,
+            reader,
+            quant_format=quant_format,
+            per_channel=args.per_channel,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=methods[args.method],
+        )
+
+    size, float_size = os.path.getsize(args.output), os.path.getsize(args.model)
+    print(f"Quantized model saved to {args.output} ({size / 2 ** 20:.2f}MiB, float model {float_size / 2 ** 20:.2f}MiB)")
+    print(f"Check its accuracy with: python test_acc.py --image_dir {args.image_dir} --model {args.output}")
+
+
+if __name__ == '__main__':
+    main()
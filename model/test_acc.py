@@ -1,12 +1,13 @@
 import argparse
 import json
 import os
+import pathlib
 import time
 from tqdm import tqdm
 
 import sys
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../build_dataset/NJUlogin'))
-from captchaOCR import CaptchaOCR
+from captchaOCR import CaptchaOCR, CascadeOCR
 from captchaOCR_ddddocr import CaptchaOCR as CaptchaOCR_ddddocr
 
 def test(ocr, image_dir, test_images):
@@ -20,9 +21,21 @@ def test(ocr, image_dir, test_images):
             correct += 1
     return correct
 
+def test_batched(ocr, image_dir, test_images, batch_size):
+    correct = 0
+    for start in tqdm(range(0, len(test_images), batch_size)):
+        image_names = test_images[start:start + batch_size]
+        texts = ocr.get_texts([pathlib.Path(image_dir, 'test', name) for name in image_names], batch_size)
+        correct += sum(text == name.split('_')[0] for text, name in zip(texts, image_names))
+    return correct
+
 def main():
     parser = argparse.ArgumentParser(description='Test NJU Captcha CNN')
     parser.add_argument('--image_dir', type=str, help='Path to image directory', required=True)
+    parser.add_argument('--model', type=str, default=None, help='ONNX model to test, e.g. checkpoints/nju_captcha_int8.onnx (default: the one shipped with captchaOCR)')
+    parser.add_argument('--batch_size', type=int, default=64, help='Batch size for testing model by me (1: one image at a time)')
+    parser.add_argument('--cascade', type=str, default=None, help='Also test a cascade escalating unsure answers to this tier: "ddddocr" or an ONNX checkpoint')
+    parser.add_argument('--threshold', type=float, default=0.9, help='Sequence confidence below which the cascade escalates')
     args = parser.parse_args()
 
     image_dir = args.image_dir
@@ -38,7 +51,7 @@ def main():
     print(f"length of captcha: {captcha_length}")
 
     print("Start testing model from ddddocr...")
-    ocr = CaptchaOCR_ddddocr()
+    ocr_ddddocr = ocr = CaptchaOCR_ddddocr()
     start_time = time.time()
     correct = test(ocr, image_dir, test_images)
     end_time = time.time()
@@ -46,13 +59,32 @@ def main():
     print(f"Accuracy: {correct / len(test_images):.2%}")
 
     print("\nStart testing model by me...")
-    ocr = CaptchaOCR()
+    ocr = CaptchaOCR(import_onnx_path=args.model)
+    print(f"Model: {ocr.import_onnx_path}")
     start_time = time.time()
-    correct = test(ocr, image_dir, test_images)
+    if args.batch_size > 1:
+        correct = test_batched(ocr, image_dir, test_images, args.batch_size)
+    else:
+        correct = test(ocr, image_dir, test_images)
     end_time = time.time()
     print(f"{len(test_images) / (end_time - start_time):.2f} images/sec")
     print(f"Accuracy: {correct / len(test_images):.2%}")
 
+    if args.cascade:
+        print(f"\nStart testing cascade to {args.cascade} below confidence {args.threshold}...")
+        fallback = ocr_ddddocr if args.cascade == 'ddddocr' else CaptchaOCR(import_onnx_path=args.cascade)
+        cascade = CascadeOCR([('cnn', ocr), (args.cascade, fallback)], args.threshold)
+        start_time = time.time()
+        correct = test(cascade, image_dir, test_images)
+        end_time = time.time()
+        print(f"{len(test_images) / (end_time - start_time):.2f} images/sec")
+        print(f"Accuracy: {correct / len(test_images):.2%}")
+        stats = cascade.stats()
+        print(f"Mean latency: {stats['mean_ms']:.2f}ms")
+        for name, tier in stats['tiers'].items():
+            print(f"  {name}: answered {tier['hit_rate']:.2%} ({tier['accepted']}/{tier['calls']} calls), "
+                  f"{tier['mean_ms']:.2f}ms per call")
+
 
 if __name__ == '__main__':
     main()
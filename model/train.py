@@ -9,7 +9,7 @@ import argparse
 from tqdm import tqdm
 
 from dataset import NJUCaptchaDataset
-from model import CaptchaCNN
+from model import CaptchaCNN, NormalizedInput
 
 
 def calculate_accuracy(outputs, targets):
@@ -88,7 +88,7 @@ def validate_epoch(model, dataloader, criterion, device):
     return avg_loss, avg_char_acc, avg_seq_acc
 
 
-def save_model(model, optimizer, epoch, loss, accuracy, filepath, input_shape=(3, 64, 176)):
+def save_model(model, optimizer, epoch, loss, accuracy, filepath, input_shape=(3, 64, 176), mean=None, std=None):
     torch.save({
         'epoch': epoch,
         'model_state_dict': model.state_dict(),
@@ -105,6 +105,15 @@ def save_model(model, optimizer, epoch, loss, accuracy, filepath, input_shape=(3
                           input_names=['input'], output_names=['output'],
                           dynamic_axes={'input': {0: 'batch_size'}, 'output': {0: 'batch_size'}},
                           opset_version=11, do_constant_folding=True)
+        if mean is not None and std is not None:
+            # variant taking uint8 N×H×W×C images, with cast, layout change and normalization in the graph
+            channels, height, width = input_shape[1:]
+            torch.onnx.export(NormalizedInput(model, mean, std),
+                              torch.randint(0, 256, (1, height, width, channels), dtype=torch.uint8, device=device),
+                              os.path.join(path, 'nju_captcha_uint8.onnx'),
+                              input_names=['input'], output_names=['output'],
+                              dynamic_axes={'input': {0: 'batch_size'}, 'output': {0: 'batch_size'}},
+                              opset_version=11, do_constant_folding=True)
 
 
 def load_model(model, optimizer, filepath):
@@ -129,6 +138,7 @@ def parse_args():
     parser.add_argument('--save_dir', type=str, default='checkpoints', help='Directory to save models')
     parser.add_argument('--resume', type=str, default=None, help='Path to checkpoint to resume from')
     parser.add_argument('--save_every', type=int, default=10, help='Save model every N epochs')
+    parser.add_argument('--grayscale', action='store_true', help='Train and export a single-channel (grayscale) model')
     return parser.parse_args()
 
 
@@ -151,8 +161,11 @@ def main():
     print(f"Number of classes: {num_classes}")
     print(f"Captcha length: {captcha_length}")
 
-    train_dataset = NJUCaptchaDataset(args.image_dir, split='train')
-    val_dataset = NJUCaptchaDataset(args.image_dir, split='val')
+    train_dataset = NJUCaptchaDataset(args.image_dir, split='train', grayscale=args.grayscale)
+    val_dataset = NJUCaptchaDataset(args.image_dir, split='val', grayscale=args.grayscale)
+    in_channels = 1 if args.grayscale else 3
+    input_shape = (in_channels, *data['image_shape'][-2:])
+    data_mean, data_std = train_dataset.mean, train_dataset.std
 
     print(f"Train dataset size: {len(train_dataset)}")
     print(f"Validation dataset size: {len(val_dataset)}")
@@ -166,7 +179,8 @@ def main():
         image_shape=data['image_shape'][-2:],
         channels=[16, 32, 48],
         conv_dropout=0.1,
-        fc_dropout=0.3
+        fc_dropout=0.3,
+        in_channels=in_channels,
     ).to(device)
 
     total_params = sum(p.numel() for p in model.parameters())
@@ -227,16 +241,16 @@ def main():
         if val_seq_acc > best_val_acc:
             best_val_acc = val_seq_acc
             best_model_path = os.path.join(args.save_dir, 'best_model.pth')
-            save_model(model, optimizer, epoch, val_loss, val_seq_acc, best_model_path, input_shape=data['image_shape'])
+            save_model(model, optimizer, epoch, val_loss, val_seq_acc, best_model_path, input_shape=input_shape, mean=data_mean, std=data_std)
             print(f"New best validation accuracy: {best_val_acc:.4f}")
             best_epoch = epoch + 1
 
         if (epoch + 1) % args.save_every == 0:
             checkpoint_path = os.path.join(args.save_dir, f'checkpoint_epoch_{epoch+1}.pth')
-            save_model(model, optimizer, epoch, val_loss, val_seq_acc, checkpoint_path, input_shape=data['image_shape'])
+            save_model(model, optimizer, epoch, val_loss, val_seq_acc, checkpoint_path, input_shape=input_shape, mean=data_mean, std=data_std)
 
     final_model_path = os.path.join(args.save_dir, 'final_model.pth')
-    save_model(model, optimizer, epoch, val_loss, val_seq_acc, final_model_path, input_shape=data['image_shape'])
+    save_model(model, optimizer, epoch, val_loss, val_seq_acc, final_model_path, input_shape=input_shape, mean=data_mean, std=data_std)
 
     total_time = time.time() - start_time
     print(f"\nTraining completed in {total_time:.2f} seconds")
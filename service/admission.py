@@ -0,0 +1,58 @@
+import math
+import threading
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"overloaded, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Reject new inference work once the backlog is too deep or too slow.
+
+    ``in_flight`` counts images admitted but not finished yet. The expected
+    wait of a new request is ``in_flight * cost / workers``, where ``cost`` is
+    the smoothed per-image cost of every stage reported through ``observe``.
+    A limit of 0 disables the corresponding check.
+    """
+
+    def __init__(self, max_queue: int = 0, max_wait_ms: float = 0, workers: int = 1, smoothing: float = 0.1):
+        self.max_queue = max(max_queue, 0)
+        self.max_wait = max(max_wait_ms, 0) / 1000
+        self.workers = max(workers, 1)
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.shed = 0
+        self._costs = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cost(self) -> float:
+        # observe() adds stages from executor threads
+        with self._lock:
+            return sum(self._costs.values())
+
+    def observe(self, stage: str, seconds_per_image: float):
+        with self._lock:
+            previous = self._costs.get(stage)
+            if previous is None:
+                self._costs[stage] = seconds_per_image
+            else:
+                self._costs[stage] = previous + self.smoothing * (seconds_per_image - previous)
+
+    def estimated_wait(self, images: int = 0) -> float:
+        return (self.in_flight + images) * self.cost / self.workers
+
+    def admit(self, images: int = 1):
+        # a lone request is always admitted, however large, so it cannot starve
+        if self.in_flight > 0:
+            too_deep = self.max_queue and self.in_flight + images > self.max_queue
+            wait = self.estimated_wait(images)
+            if too_deep or (self.max_wait and wait > self.max_wait):
+                self.shed += 1
+                raise Overloaded(max(math.ceil(wait), 1))
+        self.in_flight += images
+
+    def release(self, images: int = 1):
+        self.in_flight -= images
@@ -0,0 +1,117 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-image requests into one batched inference.
+
+    Requests wait at most ``max_wait_ms`` after the first one of a batch arrives,
+    or until ``max_batch_size`` images are queued, whichever comes first. At most
+    ``max_concurrent_batches`` batches run on ``executor`` at once; while all of
+    them are busy, new requests keep accumulating into the next batch.
+    """
+
+    def __init__(
+        self,
+        predict: Callable[[np.ndarray], list],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 2.0,
+        executor: Optional[Executor] = None,
+        max_concurrent_batches: int = 1,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(max_wait_ms, 0) / 1000
+        self.executor = executor
+        self.max_concurrent_batches = max(max_concurrent_batches, 1)
+        self._queue = None
+        self._slots = None
+        self._worker = None
+        self._pending = set()
+        self._closed = False
+
+    def _ensure_worker(self):
+        # started lazily so that the batcher binds to the loop serving requests
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def close(self):
+        """Dispatch the requests already queued, then stop the worker.
+
+        Requests submitted afterwards run one by one without batching. Safe to
+        call from any thread.
+        """
+        self._closed = True
+        worker = self._worker
+        if worker is not None and not worker.done():
+            # everything queued before this marker is still dispatched
+            worker.get_loop().call_soon_threadsafe(self._queue.put_nowait, None)
+
+    async def submit(self, image: np.ndarray) -> str:
+        if self._closed:
+            loop = asyncio.get_running_loop()
+            return (await loop.run_in_executor(self.executor, self.predict, image[np.newaxis]))[0]
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((image, future))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while batch[-1] is not None and len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            closing = batch[-1] is None
+            batch = [item for item in batch if item is not None and not item[1].cancelled()]
+            if batch:
+                task = loop.create_task(self._dispatch(batch))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+            else:
+                self._slots.release()
+            if closing:
+                return
+
+    async def _dispatch(self, batch: list):
+        loop = asyncio.get_running_loop()
+        try:
+            images = np.stack([image for image, _ in batch])
+            texts = await loop.run_in_executor(self.executor, self.predict, images)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), text in zip(batch, texts):
+                if not future.done():
+                    future.set_result(text)
+        finally:
+            self._slots.release()
@@ -0,0 +1,55 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class ResultCache:
+    """LRU cache with a per-entry TTL for recognition results.
+
+    Values are result dicts (text, confidence, probabilities, alternatives).
+    Keys are built from BLAKE2b digests of the raw image bytes, so
+    resubmitting the same captcha skips decoding and inference. Memory is bounded by ``max_entries``;
+    ``max_entries=0`` disables the cache. Not thread-safe: it is only touched
+    from the event loop.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0):
+        self.max_entries = max(max_entries, 0)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(image: bytes) -> bytes:
+        return hashlib.blake2b(image, digest_size=16).digest()
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        if not self.max_entries:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: dict):
+        if not self.max_entries:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
@@ -1 +1,3 @@
+from .cascade import CascadeOCR
 from .ocr import CaptchaOCR
+from .registry import SessionRegistry, sessions
@@ -0,0 +1,349 @@
+import struct
+from collections import namedtuple
+from typing import Callable, Union
+import pathlib
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# TensorProto.DataType -> numpy dtype
+DTYPES = {
+    1: np.float32,
+    2: np.uint8,
+    3: np.int8,
+    4: np.uint16,
+    5: np.int16,
+    6: np.int32,
+    7: np.int64,
+    9: np.bool_,
+    10: np.float16,
+    11: np.float64,
+    12: np.uint32,
+    13: np.uint64,
+}
+TYPE_NAMES = {
+    1: 'tensor(float)',
+    2: 'tensor(uint8)',
+    3: 'tensor(int8)',
+    6: 'tensor(int32)',
+    7: 'tensor(int64)',
+    10: 'tensor(float16)',
+    11: 'tensor(double)',
+}
+
+NodeArg = namedtuple('NodeArg', ['name', 'type', 'shape'])
+
+
+def _varint(buf: bytes, pos: int) -> tuple:
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _signed(value: int) -> int:
+    # int64 fields are varints of their two's complement
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _fields(buf: bytes):
+    """Yield ``(field number, wire type, value)`` for each field of a protobuf message."""
+    pos = 0
+    while pos < len(buf):
+        key, pos = _varint(buf, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _varint(buf, pos)
+        elif wire_type == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire_type}")
+        yield number, wire_type, value
+
+
+def _ints(wire_type: int, value) -> list:
+    # repeated int64 fields may be packed or not
+    if wire_type == 0:
+        return [_signed(value)]
+    values, pos = [], 0
+    while pos < len(value):
+        item, pos = _varint(value, pos)
+        values.append(_signed(item))
+    return values
+
+
+def _floats(wire_type: int, value) -> list:
+    return list(struct.unpack(f'<{len(value) // 4}f', value))
+
+
+def _tensor(buf: bytes) -> tuple:
+    dims, data_type, name, raw = [], 1, '', None
+    float_data, int_data = [], []
+    for number, wire_type, value in _fields(buf):
+        if number == 1:
+            dims += _ints(wire_type, value)
+        elif number == 2:
+            data_type = value
+        elif number == 4:
+            float_data += _floats(wire_type, value)
+        elif number in (5, 7):
+            int_data += _ints(wire_type, value)
+        elif number == 8:
+            name = value.decode()
+        elif number == 9:
+            raw = value
+        elif number == 14 and value == 1:
+            raise NotImplementedError(f"tensor {name} keeps its data in an external file")
+    dtype = DTYPES.get(data_type)
+    if dtype is None:
+        raise NotImplementedError(f"tensor {name} has unsupported data type {data_type}")
+    if raw is not None:
+        array = np.frombuffer(raw, dtype=np.dtype(dtype).newbyteorder('<')).astype(dtype)
+    elif float_data:
+        array = np.array(float_data, dtype=dtype)
+    else:
+        array = np.array(int_data, dtype=dtype)
+    return name, array.reshape(dims)
+
+
+def _attribute(buf: bytes) -> tuple:
+    name, kind = '', None
+    values = {'f': None, 'i': None, 's': None, 't': None, 'floats': [], 'ints': []}
+    for number, wire_type, value in _fields(buf):
+        if number == 1:
+            name = value.decode()
+        elif number == 2:
+            values['f'] = struct.unpack('<f', value)[0]
+        elif number == 3:
+            values['i'] = _signed(value)
+        elif number == 4:
+            values['s'] = value
+        elif number == 5:
+            values['t'] = _tensor(value)[1]
+        elif number == 7:
+            values['floats'] += _floats(wire_type, value)
+        elif number == 8:
+            values['ints'] += _ints(wire_type, value)
+        elif number == 20:
+            kind = value
+    # AttributeProto.AttributeType
+    key = {1: 'f', 2: 'i', 3: 's', 4: 't', 6: 'floats', 7: 'ints'}.get(kind)
+    if key is None:
+        raise NotImplementedError(f"attribute {name} has unsupported type {kind}")
+    return name, values[key]
+
+
+def _node(buf: bytes) -> dict:
+    node = {'inputs': [], 'outputs': [], 'name': '', 'op_type': '', 'attributes': {}}
+    for number, _, value in _fields(buf):
+        if number == 1:
+            node['inputs'].append(value.decode())
+        elif number == 2:
+            node['outputs'].append(value.decode())
+        elif number == 3:
+            node['name'] = value.decode()
+        elif number == 4:
+            node['op_type'] = value.decode()
+        elif number == 5:
+            name, attribute = _attribute(value)
+            node['attributes'][name] = attribute
+    return node
+
+
+def _value_info(buf: bytes) -> NodeArg:
+    name, elem_type, shape = '', 0, []
+    for number, _, value in _fields(buf):
+        if number == 1:
+            name = value.decode()
+        elif number == 2:
+            for type_number, _, tensor_type in _fields(value):
+                if type_number != 1:
+                    continue
+                for tensor_number, _, tensor_value in _fields(tensor_type):
+                    if tensor_number == 1:
+                        elem_type = tensor_value
+                    elif tensor_number == 2:
+                        for _, _, dim in _fields(tensor_value):
+                            size = None
+                            for dim_number, _, dim_value in _fields(dim):
+                                size = dim_value if dim_number == 1 else dim_value.decode()
+                            shape.append(size)
+    return NodeArg(name, TYPE_NAMES.get(elem_type, f'tensor({elem_type})'), shape)
+
+
+def load_onnx(path: Union[str, pathlib.PurePath]) -> tuple:
+    """Parse an ONNX model into ``(nodes, initializers, inputs, outputs)`` without the onnx package."""
+    with open(path, 'rb') as f:
+        model = f.read()
+    graph = next(value for number, _, value in _fields(model) if number == 7)
+    nodes, initializers, inputs, outputs = [], {}, [], []
+    for number, _, value in _fields(graph):
+        if number == 1:
+            nodes.append(_node(value))
+        elif number == 5:
+            name, array = _tensor(value)
+            initializers[name] = array
+        elif number == 11:
+            inputs.append(_value_info(value))
+        elif number == 12:
+            outputs.append(_value_info(value))
+    # old exporters also list the initializers as graph inputs
+    inputs = [arg for arg in inputs if arg.name not in initializers]
+    return nodes, initializers, inputs, outputs
+
+
+def _conv(attributes: dict) -> Callable:
+    group = attributes.get('group', 1)
+    strides = attributes.get('strides', [1, 1])
+    pads = attributes.get('pads', [0, 0, 0, 0])
+    if any(d != 1 for d in attributes.get('dilations', [1, 1])):
+        raise NotImplementedError("Conv with dilation")
+    if attributes.get('auto_pad', b'NOTSET') != b'NOTSET':
+        raise NotImplementedError("Conv with auto_pad")
+
+    def conv(x, weight, bias=None):
+        out_channels, group_channels, kh, kw = weight.shape
+        if any(pads):
+            x = np.pad(x, ((0, 0), (0, 0), (pads[0], pads[2]), (pads[1], pads[3])))
+        if kh == kw == 1:
+            windows = x[:, :, ::strides[0], ::strides[1], np.newaxis, np.newaxis]
+        else:
+            windows = sliding_window_view(x, (kh, kw), axis=(2, 3))[:, :, ::strides[0], ::strides[1]]
+        n, _, height, width = windows.shape[:4]
+        if group == 1:
+            # im2col: one matrix product over (channel, kernel row, kernel column)
+            y = np.tensordot(weight, windows, axes=([1, 2, 3], [1, 4, 5])).transpose(1, 0, 2, 3)
+        elif group_channels == 1 and out_channels == group:
+            # depthwise: every channel is convolved with its own kernel
+            y = np.einsum('nchwij,cij->nchw', windows, weight[:, 0], optimize=True)
+        else:
+            windows = windows.reshape(n, group, group_channels, height, width, kh, kw)
+            weight = weight.reshape(group, out_channels // group, group_channels, kh, kw)
+            y = np.einsum('ngchwij,gocij->ngohw', windows, weight, optimize=True)
+            y = y.reshape(n, out_channels, height, width)
+        if bias is not None:
+            y += bias.reshape(1, -1, 1, 1)
+        return np.ascontiguousarray(y)
+    return conv
+
+
+def _max_pool(attributes: dict) -> Callable:
+    kh, kw = attributes['kernel_shape']
+    sh, sw = attributes.get('strides', [1, 1])
+    pads = attributes.get('pads', [0, 0, 0, 0])
+    if attributes.get('ceil_mode', 0) or any(d != 1 for d in attributes.get('dilations', [1, 1])):
+        raise NotImplementedError("MaxPool with ceil_mode or dilation")
+
+    def max_pool(x):
+        if any(pads):
+            x = np.pad(x, ((0, 0), (0, 0), (pads[0], pads[2]), (pads[1], pads[3])), constant_values=-np.inf)
+        height, width = (x.shape[2] - kh) // sh + 1, (x.shape[3] - kw) // sw + 1
+        # elementwise maximum over one strided view per kernel tap is much
+        # faster than reducing over the window axes
+        y = None
+        for i in range(kh):
+            for j in range(kw):
+                tap = x[:, :, i:i + sh * height:sh, j:j + sw * width:sw]
+                y = tap.copy() if y is None else np.maximum(y, tap, out=y)
+        return y
+    return max_pool
+
+
+def _gemm(attributes: dict) -> Callable:
+    alpha, beta = attributes.get('alpha', 1.0), attributes.get('beta', 1.0)
+    trans_a, trans_b = attributes.get('transA', 0), attributes.get('transB', 0)
+
+    def gemm(a, b, c=None):
+        y = (a.T if trans_a else a) @ (b.T if trans_b else b)
+        if alpha != 1.0:
+            y *= alpha
+        if c is not None:
+            y += c if beta == 1.0 else beta * c
+        return y
+    return gemm
+
+
+def _reshape(attributes: dict) -> Callable:
+    def reshape(x, shape):
+        # 0 keeps the corresponding input dimension
+        shape = [x.shape[i] if size == 0 else size for i, size in enumerate(shape.tolist())]
+        return x.reshape(shape)
+    return reshape
+
+
+def _unsqueeze(attributes: dict) -> Callable:
+    def unsqueeze(x, axes=None):
+        axes = attributes['axes'] if axes is None else axes.tolist()
+        return np.expand_dims(x, tuple(axes))
+    return unsqueeze
+
+
+OPS = {
+    'Conv': _conv,
+    'MaxPool': _max_pool,
+    'Gemm': _gemm,
+    'Reshape': _reshape,
+    'Unsqueeze': _unsqueeze,
+    'Relu': lambda attributes: lambda x: np.maximum(x, 0, dtype=x.dtype),
+    'Add': lambda attributes: np.add,
+    'Sub': lambda attributes: np.subtract,
+    'Mul': lambda attributes: np.multiply,
+    'Mean': lambda attributes: lambda *xs: sum(xs[1:], xs[0]) / len(xs),
+    'Shape': lambda attributes: lambda x: np.array(x.shape, dtype=np.int64),
+    'Gather': lambda attributes: lambda x, indices: np.take(x, indices, axis=attributes.get('axis', 0)),
+    'Concat': lambda attributes: lambda *xs: np.concatenate(xs, axis=attributes['axis']),
+    'Flatten': lambda attributes: lambda x: x.reshape(int(np.prod(x.shape[:attributes.get('axis', 1)])), -1),
+    'Transpose': lambda attributes: lambda x: np.ascontiguousarray(x.transpose(attributes.get('perm'))),
+    'Cast': lambda attributes: lambda x: x.astype(DTYPES[attributes['to']]),
+    'Constant': lambda attributes: lambda: attributes['value'],
+}
+
+
+class NumpySession:
+    """Run an ONNX model of the CaptchaCNN family with NumPy only.
+
+    Mirrors the part of ``onnxruntime.InferenceSession`` that ``CaptchaOCR``
+    uses. Every operator becomes a closure once at load time, so a run is a
+    straight walk over the (already topologically sorted) node list.
+    """
+
+    def __init__(self, path: Union[str, pathlib.PurePath]):
+        nodes, self.initializers, self._inputs, self._outputs = load_onnx(path)
+        for name, array in self.initializers.items():
+            if array.dtype.kind == 'f':
+                # trained weights contain subnormals, which make BLAS over 10x
+                # slower; they are far below anything that changes a logit
+                tiny = np.finfo(array.dtype).tiny
+                self.initializers[name] = np.where(np.abs(array) < tiny, array.dtype.type(0), array)
+        unsupported = sorted({node['op_type'] for node in nodes} - set(OPS))
+        if unsupported:
+            raise NotImplementedError(f"operators not supported by the NumPy backend: {', '.join(unsupported)}")
+        self.nodes = [
+            (OPS[node['op_type']](node['attributes']), node['inputs'], node['outputs'])
+            for node in nodes
+        ]
+
+    def get_inputs(self) -> list:
+        return self._inputs
+
+    def get_outputs(self) -> list:
+        return self._outputs
+
+    def run(self, output_names, input_feed: dict) -> list:
+        values = dict(self.initializers)
+        values.update(input_feed)
+        for op, inputs, outputs in self.nodes:
+            # optional inputs are given as empty names
+            result = op(*(values[name] for name in inputs if name))
+            values[outputs[0]] = result
+        names = output_names or [arg.name for arg in self._outputs]
+        return [values[name] for name in names]
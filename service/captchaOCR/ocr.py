@@ -1,23 +1,109 @@
-from typing import Union, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Union, Optional
 import io
+import itertools
 import json
+import os
 import os.path as osp
 import pathlib
+import threading
+import time
 import numpy as np
-import onnxruntime
 from PIL import Image
 
+from .numpy_backend import NumpySession
+from .registry import sessions
 from .utils import base64_to_image
 
+try:
+    import onnxruntime
+except ImportError:
+    # the NumPy backend runs the model without onnxruntime installed
+    onnxruntime = None
+
+BACKENDS = ('onnxruntime', 'numpy')
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL',
+}
+EXECUTION_MODES = {
+    'sequential': 'ORT_SEQUENTIAL',
+    'parallel': 'ORT_PARALLEL',
+}
+
 
 class CaptchaOCR:
     def __init__(
         self,
         gpu_id: int = -1,
+        intra_op_num_threads: int = 0,
+        stage_hook: Optional[Callable[[str, float], None]] = None,
+        fast_decode: bool = False,
+        import_onnx_path: Optional[Union[str, pathlib.PurePath]] = None,
+        quantized: bool = False,
+        graph_optimization_level: str = 'all',
+        inter_op_num_threads: int = 0,
+        execution_mode: str = 'sequential',
+        enable_cpu_mem_arena: bool = True,
+        enable_mem_pattern: bool = True,
+        allow_spinning: Optional[bool] = None,
+        io_binding: bool = False,
+        backend: Optional[str] = None,
+        shared_session: bool = True,
     ):
-        import_onnx_path = osp.join(osp.dirname(__file__), 'nju_captcha.onnx')
+        if backend is None:
+            backend = 'onnxruntime' if onnxruntime is not None else 'numpy'
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {list(BACKENDS)}")
+        if backend == 'onnxruntime' and onnxruntime is None:
+            raise ImportError("onnxruntime is not installed, install it or use backend='numpy'")
+        if backend == 'numpy' and (gpu_id >= 0 or io_binding):
+            raise ValueError("the numpy backend supports neither gpu_id nor io_binding")
+        if graph_optimization_level not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(
+                f"graph_optimization_level must be one of {list(GRAPH_OPTIMIZATION_LEVELS)}"
+            )
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"execution_mode must be one of {list(EXECUTION_MODES)}")
+        if import_onnx_path is None and quantized:
+            import_onnx_path = osp.join(osp.dirname(__file__), 'nju_captcha_int8.onnx')
+            if not osp.exists(import_onnx_path):
+                raise FileNotFoundError(
+                    f"{import_onnx_path} not found, create it with model/quantize.py"
+                )
+        elif import_onnx_path is None:
+            # prefer the variant with normalization folded into the graph
+            import_onnx_path = osp.join(osp.dirname(__file__), 'nju_captcha_uint8.onnx')
+            if not osp.exists(import_onnx_path):
+                import_onnx_path = osp.join(osp.dirname(__file__), 'nju_captcha.onnx')
         self.charset = ['1', '2', '3', '4', '5', '6', '7', '8', 'a', 'b', 'c', 'd', 'e', 'f', 'h', 'k', 'n', 'p', 'q', 'x', 'y', 'z']
         self.resize = (176, 64)
+        self._charset = np.array(self.charset)
+        self.mean = np.array([0.743, 0.7432, 0.7431], dtype=np.float32)
+        self.std = np.array([0.1917, 0.1918, 0.1917], dtype=np.float32)
+        # called as stage_hook(stage, seconds) after each step of the pipeline
+        self.stage_hook = stage_hook
+        # let libjpeg scale in the DCT domain towards the target size while
+        # decoding, then finish with a bilinear instead of a LANCZOS resize
+        self.fast_decode = fast_decode
+        self.backend = backend
+        # run through an IOBinding with buffers preallocated per thread and batch size
+        self.io_binding = io_binding
+        self.device = 'cuda' if gpu_id >= 0 else 'cpu'
+        self.device_id = max(gpu_id, 0)
+        self.import_onnx_path = import_onnx_path
+        # reuse the session of any other instance with the same model and options
+        self.shared_session = shared_session
+        self.allow_spinning = allow_spinning
+        self.sess_options = None
+        self.providers = None
+        if backend == 'numpy':
+            self.reload_session()
+            return
         if gpu_id >= 0:
             providers = [
                 (
@@ -33,11 +119,99 @@ class CaptchaOCR:
             ]
         else:
             providers = ["CPUExecutionProvider"]
-        self.ort_session = onnxruntime.InferenceSession(
-            import_onnx_path, providers=providers
+        sess_options = onnxruntime.SessionOptions()
+        sess_options.graph_optimization_level = getattr(
+            onnxruntime.GraphOptimizationLevel, GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
         )
+        if intra_op_num_threads > 0:
+            sess_options.intra_op_num_threads = intra_op_num_threads
+        if inter_op_num_threads > 0:
+            sess_options.inter_op_num_threads = inter_op_num_threads
+        sess_options.execution_mode = getattr(onnxruntime.ExecutionMode, EXECUTION_MODES[execution_mode])
+        sess_options.enable_cpu_mem_arena = enable_cpu_mem_arena
+        sess_options.enable_mem_pattern = enable_mem_pattern
+        if allow_spinning is not None:
+            # idle pool threads busy-wait for work by default: lower latency, but burns CPU
+            sess_options.add_session_config_entry('session.intra_op.allow_spinning', '1' if allow_spinning else '0')
+            sess_options.add_session_config_entry('session.inter_op.allow_spinning', '1' if allow_spinning else '0')
+        self.sess_options = sess_options
+        self.providers = providers
+        self.reload_session()
 
-    def get_text(self, img: Union[bytes, str, pathlib.PurePath, Image.Image]):
+    def reload_session(self, intra_op_num_threads: Optional[int] = None, execution_mode: Optional[str] = None):
+        # ORT thread pools do not survive fork(): a session meant to be shared
+        # with forked processes must be single-threaded and sequential, and
+        # processes wanting more threads build their own session after the fork
+        if self.backend == 'onnxruntime':
+            if intra_op_num_threads is not None:
+                self.sess_options.intra_op_num_threads = intra_op_num_threads
+            if execution_mode is not None:
+                self.sess_options.execution_mode = getattr(onnxruntime.ExecutionMode, EXECUTION_MODES[execution_mode])
+        if self.shared_session:
+            # kept so that a host replacing the model can drop the session from the registry
+            self.session_key = self._session_key()
+            self.ort_session = sessions.get(self.session_key, self._create_session)
+        else:
+            self.session_key = None
+            self.ort_session = self._create_session()
+        model_input = self.ort_session.get_inputs()[0]
+        self.input_name = model_input.name
+        # uint8 N×H×W×C input: cast, layout change and normalization happen in the graph
+        self.uint8_input = model_input.type == 'tensor(uint8)'
+        self.input_dtype = np.uint8 if self.uint8_input else np.float32
+        # grayscale models take one channel: dim 1 of NCHW, dim 3 of uint8 NHWC input
+        channels = model_input.shape[3 if self.uint8_input else 1]
+        self.channels = channels if isinstance(channels, int) else 3
+        self._mode = 'L' if self.channels == 1 else 'RGB'
+        if self.channels == 1:
+            self._mean, self._std = self.mean.mean(keepdims=True), self.std.mean(keepdims=True)
+        else:
+            self._mean, self._std = self.mean, self.std
+        # (x / 255 - mean) / std as one subtract and one multiply on uint8 N×H×W×C batches
+        self._offset = (self._mean * 255).reshape(1, -1, 1, 1)
+        self._scale = (1 / (self._std * 255)).reshape(1, -1, 1, 1)
+        model_output = self.ort_session.get_outputs()[0]
+        self.output_name = model_output.name
+        self.output_shape = tuple(model_output.shape[1:])
+        self._bindings = threading.local()
+
+    def _create_session(self):
+        if self.backend == 'numpy':
+            # mirrors the part of the InferenceSession API used here
+            return NumpySession(self.import_onnx_path)
+        return onnxruntime.InferenceSession(
+            self.import_onnx_path, sess_options=self.sess_options, providers=self.providers
+        )
+
+    def _session_key(self) -> tuple:
+        path = osp.realpath(self.import_onnx_path)
+        # a rewritten model file gets a session of its own
+        stat = os.stat(path)
+        key = (self.backend, path, stat.st_mtime_ns, stat.st_size)
+        if self.backend == 'numpy':
+            return key
+        options = self.sess_options
+        return key + (
+            repr(self.providers),
+            options.graph_optimization_level,
+            options.intra_op_num_threads,
+            options.inter_op_num_threads,
+            options.execution_mode,
+            options.enable_cpu_mem_arena,
+            options.enable_mem_pattern,
+            self.allow_spinning,
+        )
+
+    @contextmanager
+    def _stage(self, name: str):
+        if self.stage_hook is None:
+            yield
+            return
+        start = time.perf_counter()
+        yield
+        self.stage_hook(name, time.perf_counter() - start)
+
+    def load_image(self, img: Union[bytes, str, pathlib.PurePath, Image.Image]) -> Image.Image:
         if not isinstance(img, (bytes, str, pathlib.PurePath, Image.Image)):
             raise TypeError(
                 "img must be bytes, str, pathlib.PurePath or PIL.Image.Image"
@@ -54,19 +228,192 @@ class CaptchaOCR:
             raise TypeError(
                 "img must be bytes, str, pathlib.PurePath or PIL.Image.Image"
             )
+        return image
+
+    def _decode(self, img: Union[bytes, str, pathlib.PurePath, Image.Image]) -> Image.Image:
+        with self._stage("open"):
+            image = self.load_image(img)
+            if self.fast_decode:
+                image.draft(self._mode, self.resize)
+            image.load()
+        with self._stage("resize"):
+            image = image.resize(self.resize, Image.BILINEAR if self.fast_decode else Image.LANCZOS)
+            image = image.convert(self._mode)
+        return image
+
+    def _pixels(self, image: Image.Image) -> np.ndarray:
+        pixels = np.asarray(image, dtype=np.uint8)
+        # grayscale images come as H×W
+        return pixels.reshape(pixels.shape[0], pixels.shape[1], self.channels)
+
+    def preprocess(self, img: Union[bytes, str, pathlib.PurePath, Image.Image]) -> np.ndarray:
+        image = self._decode(img)
+        with self._stage("normalize"):
+            if self.uint8_input:
+                return self._pixels(image)
+            image = self._pixels(image).astype(np.float32) / 255.0
+            image = (image - self._mean) / self._std
+            image = np.transpose(image, (2, 0, 1))
+            image = image.astype(np.float32)
+        return image
+
+    def run(self, images: np.ndarray) -> np.ndarray:
+        with self._stage("inference"):
+            if self.io_binding:
+                return self._run_with_binding(images)
+            ort_inputs = {self.input_name: images}
+            ort_outs = self.ort_session.run(None, ort_inputs)
+        return ort_outs[0]
+
+    def _run_with_binding(self, images: np.ndarray) -> np.ndarray:
+        # per thread: one binding and one output buffer, grown to the largest batch
+        # seen; the batch is bound in place and the output to the leading rows
+        state = getattr(self._bindings, 'state', None)
+        if state is None or len(state[1]) < len(images):
+            output = np.empty((len(images),) + self.output_shape, dtype=np.float32)
+            state = self._bindings.state = (self.ort_session.io_binding(), output)
+        binding, output = state
+        binding.bind_cpu_input(self.input_name, np.ascontiguousarray(images, dtype=self.input_dtype))
+        binding.bind_output(
+            self.output_name, 'cpu', 0, np.float32, (len(images),) + self.output_shape, output.ctypes.data
+        )
+        self.ort_session.run_with_iobinding(binding)
+        return output[:len(images)].copy()
+
+    def predict(self, images: np.ndarray) -> list:
+        output = self.run(images)
+        with self._stage("argmax"):
+            chars = self._charset[np.argmax(output, axis=2)]
+            # the characters of a row are adjacent, so each row reads as one string
+            texts = chars.view(f'<U{chars.shape[1]}').ravel().tolist()
+        return texts
+
+    def predict_with_confidence(self, images: np.ndarray, top_k: int = 3) -> list:
+        output = self.run(images)
+        with self._stage("argmax"):
+            output = output - output.max(axis=2, keepdims=True)
+            probs = np.exp(output)
+            probs /= probs.sum(axis=2, keepdims=True)
+            k = max(min(top_k, probs.shape[2]), 1)
+            # per position, the k most likely characters in descending order
+            candidates = np.argsort(-probs, axis=2)[:, :, :k]
+            candidate_probs = np.take_along_axis(probs, candidates, axis=2)
+            results = [
+                self._decode_confidence(row_candidates, row_probs, k)
+                for row_candidates, row_probs in zip(candidates.tolist(), candidate_probs.tolist())
+            ]
+        return results
+
+    def _decode_confidence(self, candidates: list, probs: list, k: int) -> dict:
+        # positions are independent, so keeping the k best prefixes after each
+        # position yields exactly the k most likely strings
+        beams = [('', 1.0)]
+        for position_candidates, position_probs in zip(candidates, probs):
+            beams = sorted(
+                ((text + self.charset[c], p * q) for text, p in beams for c, q in zip(position_candidates, position_probs)),
+                key=lambda beam: beam[1],
+                reverse=True,
+            )[:k]
+        return {
+            'text': beams[0][0],
+            'confidence': beams[0][1],
+            'probabilities': [position_probs[0] for position_probs in probs],
+            'alternatives': [{'text': text, 'confidence': p} for text, p in beams],
+        }
+
+    def get_text(self, img: Union[bytes, str, pathlib.PurePath, Image.Image]):
+        image = self.preprocess(img)
+        image = np.expand_dims(image, axis=0)
+        return self.predict(image)[0]
+
+    def get_texts(self, images: Iterable[Union[bytes, str, pathlib.PurePath, Image.Image]], batch_size: int = 64) -> list:
+        images = list(images)
+        if not images:
+            return []
+        batch_size = max(min(batch_size, len(images)), 1)
+        width, height = self.resize
+        # buffers are sized for one chunk and reused for every chunk
+        pixels = np.empty((batch_size, height, width, self.channels), dtype=np.uint8)
+        batch = None if self.uint8_input else np.empty((batch_size, self.channels, height, width), dtype=np.float32)
+        texts = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
+            for i, img in enumerate(chunk):
+                pixels[i] = self._pixels(self._decode(img))
+            texts += self.predict(self._normalize_batch(pixels[:len(chunk)], batch))
+        return texts
+
+    def iter_texts(
+        self,
+        items: Iterable,
+        batch_size: int = 64,
+        prefetch: int = 2,
+        num_workers: Optional[int] = None,
+    ) -> Iterator[tuple]:
+        """Recognize a stream of images, yielding ``(key, text)`` in input order.
+
+        Items are images or ``(key, image)`` pairs; a bare path is its own key
+        and any other bare image is keyed by its position. Up to ``prefetch``
+        batches are decoded by a thread pool while the current one runs
+        through the model, so at most ``(prefetch + 1) * batch_size`` images
+        are held in memory.
+        """
+        batch_size = max(batch_size, 1)
+        prefetch = max(prefetch, 1)
+        num_workers = num_workers or min(os.cpu_count() or 1, 4)
+        width, height = self.resize
+        # a ring of pixel buffers: one per prefetched batch plus the one being inferred
+        buffers = [np.empty((batch_size, height, width, self.channels), dtype=np.uint8) for _ in range(prefetch + 1)]
+        batch = None if self.uint8_input else np.empty((batch_size, self.channels, height, width), dtype=np.float32)
+        items = enumerate(items)
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="captcha-decode")
+
+        def decode_into(pixels: np.ndarray, index: int, img):
+            pixels[index] = self._pixels(self._decode(img))
+
+        def submit(number: int) -> bool:
+            chunk = list(itertools.islice(items, batch_size))
+            if not chunk:
+                return False
+            pixels = buffers[number % len(buffers)]
+            keys, futures = [], []
+            for index, (position, item) in enumerate(chunk):
+                if isinstance(item, tuple):
+                    key, img = item
+                else:
+                    key, img = (item if isinstance(item, pathlib.PurePath) else position), item
+                keys.append(key)
+                futures.append(executor.submit(decode_into, pixels, index, img))
+            pending.append((keys, futures, pixels))
+            return True
+
+        try:
+            submitted = 0
+            while len(pending) < prefetch and submit(submitted):
+                submitted += 1
+            while pending:
+                keys, futures, pixels = pending.popleft()
+                for future in futures:
+                    future.result()
+                # the freed slot of the ring is the one inferred last round
+                if submit(submitted):
+                    submitted += 1
+                texts = self.predict(self._normalize_batch(pixels[:len(keys)], batch))
+                yield from zip(keys, texts)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
-        image = image.resize(self.resize, Image.LANCZOS)
-        image = image.convert("RGB")
+    def _normalize_batch(self, pixels: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+        with self._stage("normalize"):
+            if self.uint8_input:
+                return pixels
+            out = out[:len(pixels)]
+            np.subtract(pixels.transpose(0, 3, 1, 2), self._offset, out=out)
+            np.multiply(out, self._scale, out=out)
+        return out
 
-        image = np.array(image, dtype=np.float32) / 255.0
+    def get_text_with_confidence(self, img: Union[bytes, str, pathlib.PurePath, Image.Image], top_k: int = 3) -> dict:
+        image = self.preprocess(img)
         image = np.expand_dims(image, axis=0)
-        image = (image - np.array([0.743, 0.7432, 0.7431], dtype=np.float32)) / np.array([0.1917, 0.1918, 0.1917], dtype=np.float32)
-        image = np.transpose(image, (0, 3, 1, 2))
-        image = image.astype(np.float32)
-        ort_inputs = {'input': image}
-        ort_outs = self.ort_session.run(None, ort_inputs)
-        output = ort_outs[0]
-        output = np.argmax(output, axis=2)
-        output = output[0].tolist()
-        text = ''.join([self.charset[i] for i in output])
-        return text
+        return self.predict_with_confidence(image, top_k)[0]
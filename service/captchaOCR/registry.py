@@ -0,0 +1,47 @@
+import threading
+from typing import Callable, Hashable
+
+
+class SessionRegistry:
+    """Share inference sessions between ``CaptchaOCR`` instances.
+
+    Sessions are keyed by everything that shapes them: backend, resolved
+    model path and session options. Both onnxruntime and NumPy sessions can
+    be run from several threads at once, so one instance per key is enough.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.reused = 0
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, factory: Callable[[], object]):
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self.reused += 1
+                return session
+            # loading is rare, so building under the lock keeps it simple:
+            # racing callers wait and then reuse the one session
+            session = self._sessions[key] = factory()
+            self.created += 1
+            return session
+
+    def discard(self, key: Hashable):
+        # instances already holding the session keep using it
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> dict:
+        return {'sessions': len(self), 'created': self.created, 'reused': self.reused}
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+sessions = SessionRegistry()
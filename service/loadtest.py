@@ -0,0 +1,234 @@
+import argparse
+import base64
+import glob
+import http.client
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+
+KINDS = ("form", "image", "batch")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test the NJU captcha recognition service')
+    parser.add_argument('--url', type=str, default=None, help='Base URL of a running service; starts main.py locally when omitted')
+    parser.add_argument('--port', type=int, default=8765, help='Port for the locally started service')
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run the load for')
+    parser.add_argument('--requests', type=int, default=0, help='Stop after this many requests in total (0: use --duration only)')
+    parser.add_argument('--mix', type=str, default='form=1,image=1', help='Request mix as kind=weight pairs, kinds: form, image, batch')
+    parser.add_argument('--batch_size', type=int, default=16, help='Images per /batch request')
+    parser.add_argument('--image_dir', type=str, default=None, help='Directory of dataset images (*.jpg) to draw requests from')
+    parser.add_argument('--max_images', type=int, default=1000, help='Maximum number of dataset images to load')
+    parser.add_argument('--bypass_cache', action='store_true', help='Append random bytes to every image so the result cache never hits')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--output', type=str, default=None, help='Also write the JSON report to this file')
+    return parser.parse_args()
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise ValueError(f"unknown request kind '{kind}', expected one of {KINDS}")
+        weights[kind] = float(weight or 1)
+    if sum(weights.values()) <= 0:
+        raise ValueError("the request mix needs a positive weight")
+    return weights
+
+
+def load_images(image_dir: str, max_images: int) -> list:
+    paths = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'captcha.jpg')]
+    if image_dir:
+        paths += sorted(glob.glob(os.path.join(image_dir, '**', '*.jpg'), recursive=True))[:max_images]
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    return images
+
+
+def build_request(kind: str, images: list, rng: random.Random, batch_size: int, bypass_cache: bool):
+    def pick() -> bytes:
+        image = rng.choice(images)
+        # JPEG decoders ignore trailing bytes after the end-of-image marker
+        return image + rng.randbytes(8) if bypass_cache else image
+
+    if kind == 'form':
+        body = urllib.parse.urlencode({'captcha': base64.b64encode(pick()).decode()}).encode()
+        return '/', body, 'application/x-www-form-urlencoded', 1
+    if kind == 'image':
+        return '/image', pick(), 'image/jpeg', 1
+    body = json.dumps([base64.b64encode(pick()).decode() for _ in range(batch_size)]).encode()
+    return '/batch', body, 'application/json', batch_size
+
+
+class Client(threading.Thread):
+    def __init__(self, index: int, args, target: urllib.parse.SplitResult, weights: dict, images: list,
+                 deadline: float, budget):
+        super().__init__(daemon=True)
+        self.args = args
+        self.target = target
+        self.weights = weights
+        self.images = images
+        self.deadline = deadline
+        self.budget = budget
+        self.rng = random.Random(args.seed * 1000003 + index)
+        self.results = []
+        self.connection = None
+
+    def connect(self):
+        cls = http.client.HTTPSConnection if self.target.scheme == 'https' else http.client.HTTPConnection
+        self.connection = cls(self.target.hostname, self.target.port, timeout=self.args.timeout)
+
+    def run(self):
+        kinds, weights = list(self.weights), list(self.weights.values())
+        prefix = self.target.path.rstrip('/')
+        while time.perf_counter() < self.deadline and self.budget():
+            kind = self.rng.choices(kinds, weights)[0]
+            path, body, content_type, count = build_request(
+                kind, self.images, self.rng, self.args.batch_size, self.args.bypass_cache)
+            if self.connection is None:
+                self.connect()
+            start = time.perf_counter()
+            try:
+                self.connection.request('POST', prefix + path, body=body, headers={'Content-Type': content_type})
+                response = self.connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                self.connection.close()
+                self.connection = None
+                status = 0
+            self.results.append((kind, time.perf_counter() - start, status, count))
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return None
+    # nearest-rank percentile of an already sorted list
+    index = min(max(math.ceil(q / 100 * len(values)) - 1, 0), len(values) - 1)
+    return values[index]
+
+
+def summarize(results: list, elapsed: float) -> dict:
+    def stats(items: list) -> dict:
+        latencies = sorted(latency for _, latency, _, _ in items)
+        errors = sum(1 for _, _, status, _ in items if status != 200)
+        return {
+            'requests': len(items),
+            'images': sum(count for _, _, status, count in items if status == 200),
+            'errors': errors,
+            'error_rate': errors / len(items) if items else 0.0,
+            'requests_per_sec': len(items) / elapsed if elapsed else 0.0,
+            'latency_ms': {
+                'mean': sum(latencies) / len(latencies) * 1000 if latencies else None,
+                'p50': percentile(latencies, 50) * 1000 if latencies else None,
+                'p95': percentile(latencies, 95) * 1000 if latencies else None,
+                'p99': percentile(latencies, 99) * 1000 if latencies else None,
+                'max': latencies[-1] * 1000 if latencies else None,
+            },
+        }
+
+    by_kind = defaultdict(list)
+    statuses = defaultdict(int)
+    for item in results:
+        by_kind[item[0]].append(item)
+        statuses[str(item[2])] += 1
+    report = stats(results)
+    report['images_per_sec'] = report['images'] / elapsed if elapsed else 0.0
+    report['elapsed_sec'] = elapsed
+    report['status_codes'] = dict(statuses)
+    report['by_kind'] = {kind: stats(items) for kind, items in by_kind.items()}
+    return report
+
+
+def wait_ready(target: urllib.parse.SplitResult, process: subprocess.Popen, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"service exited with status {process.returncode} before becoming ready")
+        try:
+            connection = http.client.HTTPConnection(target.hostname, target.port, timeout=2)
+            connection.request('GET', '/readyz')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("service did not become ready in time")
+
+
+def main():
+    args = parse_args()
+    weights = parse_mix(args.mix)
+    images = load_images(args.image_dir, args.max_images)
+
+    process = None
+    if args.url is None:
+        url = f'http://127.0.0.1:{args.port}'
+        env = dict(os.environ, PORT=str(args.port))
+        main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+        process = subprocess.Popen([sys.executable, main_path], env=env, cwd=os.path.dirname(main_path),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+        url = args.url
+    target = urllib.parse.urlsplit(url)
+    if target.port is None:
+        target = target._replace(netloc=f"{target.hostname}:{443 if target.scheme == 'https' else 80}")
+
+    try:
+        if process is not None:
+            wait_ready(target, process)
+        lock = threading.Lock()
+        issued = [0]
+
+        def budget() -> bool:
+            if not args.requests:
+                return True
+            with lock:
+                issued[0] += 1
+                return issued[0] <= args.requests
+
+        start = time.perf_counter()
+        clients = [Client(i, args, target, weights, images, start + args.duration, budget)
+                   for i in range(args.concurrency)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = summarize([item for client in clients for item in client.results], elapsed)
+    report['config'] = {
+        'url': url,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'mix': weights,
+        'batch_size': args.batch_size,
+        'distinct_images': len(images),
+        'bypass_cache': args.bypass_cache,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,258 @@
+import asyncio
 import base64
+import binascii
+import itertools
+import json
 import os
+import pathlib
+import threading
+import time
 import traceback
-from fastapi import FastAPI, Response
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 from starlette.requests import Request
-from starlette.responses import PlainTextResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 import uvicorn
-from captchaOCR import CaptchaOCR
+import numpy as np
+from captchaOCR import CaptchaOCR, sessions
+from admission import AdmissionController, Overloaded
+from batcher import MicroBatcher
+from cache import ResultCache
+from models import ModelStore
+from singleflight import SingleFlight
+from metrics import Registry
 
-ocr = CaptchaOCR()
-app = FastAPI(debug=False, docs_url=None, redoc_url=None)
+cpu_count = os.cpu_count() or 1
+processes = max(int(os.environ.get("WORKERS", 1)), 1)
+cores_per_process = max(cpu_count // processes, 1)
+infer_workers = max(int(os.environ.get("INFER_WORKERS", min(cores_per_process, 4))), 1)
+# processes x workers x intra-op threads should not exceed the cores available
+ort_threads = int(os.environ.get("ORT_INTRA_OP_THREADS", max(cores_per_process // infer_workers, 1)))
+ort_execution_mode = os.environ.get("ORT_EXECUTION_MODE", "sequential")
+ort_allow_spinning = os.environ.get("ORT_ALLOW_SPINNING")
+max_concurrency = max(int(os.environ.get("MAX_CONCURRENCY", infer_workers * 16)), 1)
+max_image_bytes = int(os.environ.get("MAX_IMAGE_BYTES", 256 * 1024))
+max_batch_items = int(os.environ.get("MAX_BATCH_ITEMS", 256))
+# room for the part headers and boundary around each uploaded image
+multipart_overhead = 4096
+warmup_rounds = int(os.environ.get("WARMUP_ROUNDS", 1))
+top_k = max(int(os.environ.get("TOP_K", 3)), 1)
+ws_max_in_flight = max(int(os.environ.get("WS_MAX_IN_FLIGHT", 64)), 1)
+admission = AdmissionController(
+    max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", 1024)),
+    max_wait_ms=float(os.environ.get("ADMISSION_MAX_WAIT_MS", 2000)),
+    workers=infer_workers,
+)
+
+registry = Registry()
+requests_total = registry.counter("captcha_http_requests_total", "HTTP requests handled.", ("method", "path", "status"))
+errors_total = registry.counter("captcha_http_errors_total", "HTTP requests answered with a 4xx/5xx status.", ("path", "status"))
+in_flight = registry.gauge("captcha_http_requests_in_flight", "HTTP requests currently being handled.")
+request_seconds = registry.histogram("captcha_http_request_seconds", "HTTP request latency.", ("path",))
+stage_seconds = registry.histogram("captcha_stage_seconds", "Latency of each recognition stage.", ("stage",))
+ws_connections = registry.gauge("captcha_ws_connections", "Open WebSocket connections.")
+ws_messages_total = registry.counter("captcha_ws_messages_total", "Captchas received over WebSocket.", ("status",))
+batch_size = registry.histogram("captcha_batch_size", "Images per ort_session.run call.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+batch_max_size = int(os.environ.get("BATCH_MAX_SIZE", 32))
+batch_max_wait_ms = float(os.environ.get("BATCH_MAX_WAIT_MS", 2))
+model_dir = os.environ.get("MODEL_DIR") or None
+# the pre-fork master shares single-threaded sessions, see after_fork
+session_threads = ort_threads if processes == 1 else 1
+session_mode = ort_execution_mode if processes == 1 else "sequential"
+executor = ThreadPoolExecutor(max_workers=infer_workers, thread_name_prefix="captcha")
+inference_limit = asyncio.Semaphore(max_concurrency)
+model_ids = itertools.count()
+
+
+# set on the thread running a warm-up, whose synthetic batches stay out of the stage histogram
+warming = threading.local()
+
+
+def observe_stage(stage: str, seconds: float):
+    if not getattr(warming, "active", False):
+        stage_seconds.observe(seconds, stage=stage)
+
+
+class Model:
+    """One served model file: its recognizer and the micro-batcher in front of it."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.ocr = CaptchaOCR(
+            intra_op_num_threads=session_threads,
+            execution_mode=session_mode,
+            inter_op_num_threads=int(os.environ.get("ORT_INTER_OP_THREADS", 0)),
+            graph_optimization_level=os.environ.get("ORT_GRAPH_OPTIMIZATION", "all"),
+            enable_cpu_mem_arena=os.environ.get("ORT_CPU_MEM_ARENA", "1") == "1",
+            enable_mem_pattern=os.environ.get("ORT_MEM_PATTERN", "1") == "1",
+            allow_spinning=None if ort_allow_spinning is None else ort_allow_spinning == "1",
+            io_binding=os.environ.get("ORT_IO_BINDING", "0") == "1",
+            backend=os.environ.get("BACKEND") or None,
+            import_onnx_path=path,
+            fast_decode=os.environ.get("FAST_DECODE", "0") == "1",
+            quantized=os.environ.get("QUANTIZED", "0") == "1",
+            stage_hook=observe_stage,
+        )
+        self.path = self.ocr.import_onnx_path
+        self.name = pathlib.Path(self.path).stem
+        # cache and single-flight keys start with it, so a reloaded file never answers from its predecessor's results
+        self.id = next(model_ids)
+        self.loaded_at = time.time()
+        self.batcher = MicroBatcher(
+            self.predict,
+            max_batch_size=batch_max_size,
+            max_wait_ms=batch_max_wait_ms,
+            executor=executor,
+            max_concurrent_batches=infer_workers,
+        )
+
+    def predict(self, images: np.ndarray) -> list:
+        batch_size.observe(len(images))
+        start = time.perf_counter()
+        results = self.ocr.predict_with_confidence(images, top_k)
+        admission.observe("inference", (time.perf_counter() - start) / len(images))
+        return results
+
+    def preprocess(self, image: bytes) -> np.ndarray:
+        start = time.perf_counter()
+        array = self.ocr.preprocess(image)
+        admission.observe("preprocess", time.perf_counter() - start)
+        return array
+
+    def predict_many(self, images: list) -> list:
+        # an image that fails to decode yields its exception and fails only its own entry
+        arrays, results = [], []
+        for image in images:
+            try:
+                arrays.append(self.preprocess(image))
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        if arrays:
+            predictions = iter(self.predict(np.stack(arrays)))
+            results = [next(predictions) if result is None else result for result in results]
+        return results
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "input": "uint8" if self.ocr.uint8_input else "float32",
+            "loaded_at": self.loaded_at,
+        }
+
+
+def load_model(path: str) -> Model:
+    model = Model(path)
+    # models loaded at start-up are warmed by warmup(); reloads go live warm
+    if ready.is_set():
+        warm(model)
+    return model
+
+
+def unload_model(model: Model):
+    # requests still holding the model finish on it; its session is freed with the last of them
+    model.batcher.close()
+    sessions.discard(model.ocr.session_key)
+
+
+ready = threading.Event()
+store = ModelStore(
+    load_model,
+    model_dir=model_dir,
+    default=os.environ.get("DEFAULT_MODEL") or None,
+    interval=float(os.environ.get("MODEL_WATCH_INTERVAL", 2)),
+    unload=unload_model,
+)
+if model_dir is None:
+    bundled = Model(os.environ.get("MODEL_PATH") or None)
+    store.put(bundled.name, bundled)
+else:
+    store.refresh()
+cache = ResultCache(
+    max_entries=int(os.environ.get("CACHE_MAX_ENTRIES", 10000)),
+    ttl=float(os.environ.get("CACHE_TTL", 300)),
+)
+flights = SingleFlight()
+registry.counter("captcha_singleflight_shared_total", "Images answered by joining an identical in-flight recognition.", function=lambda: flights.shared)
+registry.counter("captcha_sessions_created_total", "Inference sessions loaded from a model file.", function=lambda: sessions.created)
+registry.counter("captcha_sessions_reused_total", "CaptchaOCR set-ups served by an already loaded session.", function=lambda: sessions.reused)
+registry.counter("captcha_model_loads_total", "Model files loaded, at start-up or by hot reload.", function=lambda: store.loads)
+registry.counter("captcha_model_load_failures_total", "Model files that failed to load.", function=lambda: store.failures)
+registry.gauge("captcha_models", "Models currently served.", function=lambda: len(store.models()))
+registry.counter("captcha_cache_hits_total", "Result cache hits.", function=lambda: cache.hits)
+registry.counter("captcha_cache_misses_total", "Result cache misses.", function=lambda: cache.misses)
+registry.counter("captcha_cache_evictions_total", "Result cache LRU evictions.", function=lambda: cache.evictions)
+registry.gauge("captcha_cache_entries", "Entries in the result cache.", function=lambda: len(cache))
+registry.gauge("captcha_inference_in_flight", "Images admitted for decoding/inference and not finished yet.", function=lambda: admission.in_flight)
+registry.gauge("captcha_estimated_wait_seconds", "Estimated queueing delay for a new image.", function=lambda: admission.estimated_wait())
+registry.counter("captcha_shed_total", "Requests rejected with 503 by admission control.", function=lambda: admission.shed)
+registry.gauge("captcha_ready", "1 once the warm-up inferences have finished.", function=lambda: int(ready.is_set()))
+
+
+def warmup_batch_sizes() -> list:
+    # every size the micro-batcher can produce, plus powers of two up to /batch's limit
+    sizes = set(range(1, batch_max_size + 1))
+    size = 1
+    while size < max_batch_items:
+        sizes.add(size)
+        size *= 2
+    sizes.add(max_batch_items)
+    return sorted(sizes)
+
+
+def warm(model: Model):
+    warming.active = True
+    try:
+        image = model.ocr.preprocess(pathlib.Path(__file__).with_name("captcha.jpg"))
+        for _ in range(warmup_rounds):
+            for size in warmup_batch_sizes():
+                model.ocr.predict(np.repeat(image[np.newaxis], size, axis=0))
+    finally:
+        warming.active = False
+
+
+def warmup():
+    for model in store.models().values():
+        warm(model)
+    ready.set()
+
+
+def after_fork():
+    global session_threads, session_mode
+    if ort_threads != 1 or ort_execution_mode != "sequential":
+        ready.clear()
+        session_threads, session_mode = ort_threads, ort_execution_mode
+        for model in store.models().values():
+            model.ocr.reload_session(intra_op_num_threads=ort_threads, execution_mode=ort_execution_mode)
+        warmup()
+
+
+def report_warmup_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print("Warm-up failed:\n" + "".join(traceback.format_exception(future.exception())))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ready.is_set():
+        store.watch()
+    else:
+        # warm up in the background so that liveness checks answer meanwhile
+        startup = asyncio.get_running_loop().run_in_executor(executor, warmup)
+        startup.add_done_callback(report_warmup_failure)
+        # hot reloads warm their model themselves once the start-up warm-up is over
+        startup.add_done_callback(lambda future: store.watch())
+    yield
+    store.stop()
+
+
+app = FastAPI(debug=False, docs_url=None, redoc_url=None, lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -19,19 +262,398 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        in_flight.dec()
+        route = request.scope.get("route")
+        path = route.path if route is not None else "other"
+        requests_total.inc(method=request.method, path=path, status=status)
+        request_seconds.observe(time.perf_counter() - start, path=path)
+        if status >= 400:
+            errors_total.inc(path=path, status=status)
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class UnknownModel(Exception):
+    pass
+
+
+def resolve_model(version: Optional[str]) -> Model:
+    model = store.get(version)
+    if model is None:
+        raise UnknownModel(version)
+    return model
+
+
+def unknown_model_message(e: UnknownModel) -> str:
+    if e.args[0] is None:
+        return "No model loaded."
+    return f"Unknown model '{e.args[0]}'."
+
+
+def unknown_model_response(e: UnknownModel) -> Response:
+    return Response(status_code=503 if e.args[0] is None else 404, content=unknown_model_message(e))
+
+
+async def limited_stream(request: Request, limit: int):
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > limit:
+        raise PayloadTooLarge()
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise PayloadTooLarge()
+        yield chunk
+
+
+async def read_body(request: Request, limit: int) -> bytes:
+    return b"".join([chunk async for chunk in limited_stream(request, limit)])
+
+
+async def read_form(request: Request, limit: int, max_files: int) -> FormData:
+    # parsed from the capped stream, so an oversized upload stops being read instead of spooling to disk
+    parser = MultiPartParser(request.headers, limited_stream(request, limit), max_files=max_files)
+    return await parser.parse()
+
+
+async def read_upload(upload: UploadFile, limit: int) -> bytes:
+    data = await upload.read(limit + 1)
+    if len(data) > limit:
+        raise PayloadTooLarge()
+    return data
+
+
+def b64decode(data: str, validate: bool = False) -> bytes:
+    start = time.perf_counter()
+    image = base64.b64decode(data.replace(" ", "+"), validate=validate)
+    stage_seconds.observe(time.perf_counter() - start, stage="b64decode")
+    return image
+
+
+async def infer_one(model: Model, image: bytes, key: tuple) -> list:
+    loop = asyncio.get_running_loop()
+    admission.admit()
+    try:
+        async with inference_limit:
+            array = await loop.run_in_executor(executor, model.preprocess, image)
+            result = await model.batcher.submit(array)
+    finally:
+        admission.release()
+    cache.put(key, result)
+    return [result]
+
+
+async def recognize(image: bytes, version: Optional[str] = None) -> dict:
+    model = resolve_model(version)
+    key = (model.id, cache.key(image))
+    result = cache.get(key)
+    if result is not None:
+        return result
+    shared = flights.join(key)
+    if shared is not None:
+        return await shared
+    return (await flights.start([key], infer_one(model, image, key)))[0]
+
+
+async def infer_many(model: Model, images: list, keys: list) -> list:
+    loop = asyncio.get_running_loop()
+    admission.admit(len(images))
+    try:
+        async with inference_limit:
+            results = await loop.run_in_executor(executor, model.predict_many, images)
+    finally:
+        admission.release(len(images))
+    for key, result in zip(keys, results):
+        if not isinstance(result, Exception):
+            cache.put(key, result)
+    return results
+
+
+async def recognize_many(images: list, version: Optional[str] = None) -> list:
+    model = resolve_model(version)
+    keys = [(model.id, cache.key(image)) for image in images]
+    results = {}
+    pending = {}
+    missing = {}
+    for key, image in zip(keys, images):
+        if key in results or key in pending or key in missing:
+            continue
+        result = cache.get(key)
+        if result is not None:
+            results[key] = result
+            continue
+        shared = flights.join(key)
+        if shared is not None:
+            pending[key] = shared
+        else:
+            missing[key] = image
+    # awaited together, so a failing shared flight still leaves our own flight's outcome retrieved
+    waiting = list(pending.values())
+    if missing:
+        waiting.append(flights.start(list(missing), infer_many(model, list(missing.values()), list(missing))))
+    outcomes = await asyncio.gather(*waiting)
+    results.update(zip(pending, outcomes))
+    if missing:
+        results.update(zip(missing, outcomes[-1]))
+    for result in results.values():
+        if isinstance(result, Exception):
+            raise result
+    return [results[key] for key in keys]
+
+
+def wants_json(request: Request) -> bool:
+    return request.query_params.get("format") == "json"
+
+
+def render_result(request: Request, result: dict) -> Response:
+    if wants_json(request):
+        return JSONResponse(result)
+    return PlainTextResponse(result["text"])
+
+
+def overloaded_response(e: Overloaded) -> Response:
+    return Response(
+        status_code=503,
+        content="Server overloaded, retry later.",
+        headers={"Retry-After": str(int(e.retry_after))},
+    )
+
+
 @app.post("/")
+@app.post("/models/{version}")
 async def identify_captcha(request: Request) -> Response:
+    image = None
     try:
-        image = dict(await request.form())["captcha"].replace(" ", "+")
-        image = base64.b64decode(image)
-        return PlainTextResponse(ocr.get_text(image))
+        image = dict(await request.form())["captcha"]
+        image = b64decode(image)
+        return render_result(request, await recognize(image, request.path_params.get("version")))
     except KeyError as e:
         return Response(status_code=400, content="Missing 'captcha' field in the request body.")
+    except UnknownModel as e:
+        return unknown_model_response(e)
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(traceback.format_exc() + str(image))
         return Response(status_code=500, content="Internal Server Error")
 
 
+@app.post("/image")
+@app.post("/models/{version}/image")
+async def identify_captcha_image(request: Request) -> Response:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        if content_type == "multipart/form-data":
+            form = await read_form(request, max_image_bytes + multipart_overhead, max_files=1)
+            try:
+                upload = form.get("captcha") or form.get("file")
+                if not isinstance(upload, UploadFile):
+                    return Response(status_code=400, content="Missing 'captcha' file in the request body.")
+                image = await read_upload(upload, max_image_bytes)
+            finally:
+                await form.close()
+        elif content_type.startswith("image/") or content_type == "application/octet-stream":
+            image = await read_body(request, max_image_bytes)
+        else:
+            return Response(status_code=415, content="Send the image as image/jpeg, application/octet-stream or multipart/form-data.")
+        if not image:
+            return Response(status_code=400, content="Empty request body.")
+        return render_result(request, await recognize(image, request.path_params.get("version")))
+    except PayloadTooLarge:
+        return Response(status_code=413, content=f"Image larger than {max_image_bytes} bytes.")
+    except MultiPartException as e:
+        return Response(status_code=400, content=e.message)
+    except OSError:
+        # UnidentifiedImageError, or a truncated/corrupt image failing to load
+        return Response(status_code=400, content="Cannot decode the image.")
+    except UnknownModel as e:
+        return unknown_model_response(e)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        print(traceback.format_exc())
+        return Response(status_code=500, content="Internal Server Error")
+
+
+@app.post("/batch")
+@app.post("/models/{version}/batch")
+async def identify_captcha_batch(request: Request) -> Response:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        if content_type == "multipart/form-data":
+            # one file more than allowed still parses, so that the count check below answers it with 413
+            limit = (max_image_bytes + multipart_overhead) * (max_batch_items + 1)
+            form = await read_form(request, limit, max_files=max_batch_items + 1)
+            try:
+                uploads = [value for key, value in form.multi_items() if key in ("captcha", "file")]
+                if len(uploads) > max_batch_items:
+                    return Response(status_code=413, content=f"At most {max_batch_items} images per batch.")
+                if not all(isinstance(upload, UploadFile) for upload in uploads):
+                    return Response(status_code=400, content="Fields 'captcha'/'file' must be file uploads.")
+                images = [await read_upload(upload, max_image_bytes) for upload in uploads]
+            finally:
+                await form.close()
+        elif content_type == "application/json":
+            body = json.loads(await read_body(request, max_image_bytes * 4 // 3 * max_batch_items))
+            if isinstance(body, dict):
+                body = body.get("captchas")
+            if not isinstance(body, list) or not all(isinstance(item, str) for item in body):
+                return Response(status_code=400, content="Expected a JSON array of base64 images or {\"captchas\": [...]}.")
+            if len(body) > max_batch_items:
+                return Response(status_code=413, content=f"At most {max_batch_items} images per batch.")
+            images = [b64decode(item, validate=True) for item in body]
+        else:
+            return Response(status_code=415, content="Send the images as application/json or multipart/form-data.")
+        if not images:
+            return JSONResponse([])
+        if len(images) > max_batch_items:
+            return Response(status_code=413, content=f"At most {max_batch_items} images per batch.")
+        results = await recognize_many(images, request.path_params.get("version"))
+        if wants_json(request):
+            return JSONResponse(results)
+        return JSONResponse([result["text"] for result in results])
+    except PayloadTooLarge:
+        return Response(status_code=413, content=f"Images larger than {max_image_bytes} bytes each or too many images.")
+    except (json.JSONDecodeError, binascii.Error):
+        return Response(status_code=400, content="Malformed JSON or base64 data.")
+    except MultiPartException as e:
+        return Response(status_code=400, content=e.message)
+    except OSError:
+        return Response(status_code=400, content="Cannot decode one of the images.")
+    except UnknownModel as e:
+        return unknown_model_response(e)
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        print(traceback.format_exc())
+        return Response(status_code=500, content="Internal Server Error")
+
+
+def discard_task(tasks: set):
+    def callback(task: asyncio.Task):
+        tasks.discard(task)
+        if not task.cancelled():
+            task.exception()
+    return callback
+
+
+@app.websocket("/ws")
+@app.websocket("/models/{version}/ws")
+async def identify_captcha_ws(websocket: WebSocket):
+    await websocket.accept()
+    # resolved per message, so long-lived connections move on to reloaded models too
+    version = websocket.path_params.get("version")
+    ws_connections.inc()
+    send_lock = asyncio.Lock()
+    slots = asyncio.Semaphore(ws_max_in_flight)
+    tasks = set()
+
+    async def reply(request_id, result: dict = None, error: str = None, details: bool = False):
+        ws_messages_total.inc(status="ok" if error is None else "error")
+        if error is not None:
+            message = {"id": request_id, "error": error}
+        elif details:
+            message = {"id": request_id, **result}
+        else:
+            message = {"id": request_id, "text": result["text"], "confidence": result["confidence"]}
+        async with send_lock:
+            await websocket.send_text(json.dumps(message))
+
+    async def handle(request_id, image: bytes, details: bool):
+        try:
+            try:
+                result = await recognize(image, version)
+            except OSError:
+                await reply(request_id, error="Cannot decode the image.")
+            except UnknownModel as e:
+                await reply(request_id, error=unknown_model_message(e))
+            except Overloaded as e:
+                await reply(request_id, error=f"Server overloaded, retry after {int(e.retry_after)}s.")
+            except Exception:
+                print(traceback.format_exc())
+                await reply(request_id, error="Internal Server Error")
+            else:
+                await reply(request_id, result, details=details)
+        finally:
+            slots.release()
+
+    seq = 0
+    try:
+        while True:
+            # at most ws_max_in_flight captchas per connection, then stop reading
+            await slots.acquire()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            request_id, seq = seq, seq + 1
+            details = websocket.query_params.get("format") == "json"
+            try:
+                if message.get("bytes") is not None:
+                    image = message["bytes"]
+                else:
+                    body = json.loads(message.get("text") or "")
+                    if not isinstance(body, dict) or not isinstance(body.get("captcha"), str):
+                        raise ValueError()
+                    request_id = body.get("id", request_id)
+                    details = body.get("format", "json" if details else "text") == "json"
+                    image = b64decode(body["captcha"], validate=True)
+            except (ValueError, binascii.Error):
+                slots.release()
+                await reply(request_id, error="Expected a binary image or {\"id\": ..., \"captcha\": \"<base64>\"}.")
+                continue
+            if not image or len(image) > max_image_bytes:
+                slots.release()
+                await reply(request_id, error=f"Image must be between 1 and {max_image_bytes} bytes.")
+                continue
+            task = asyncio.create_task(handle(request_id, image, details))
+            tasks.add(task)
+            task.add_done_callback(discard_task(tasks))
+    finally:
+        ws_connections.dec()
+        for task in list(tasks):
+            task.cancel()
+
+
+@app.get("/healthz")
+async def liveness() -> Response:
+    return PlainTextResponse("ok")
+
+
+@app.get("/readyz")
+async def readiness() -> Response:
+    if not ready.is_set():
+        return PlainTextResponse("warming up", status_code=503)
+    if store.get() is None:
+        return PlainTextResponse("no model loaded", status_code=503)
+    return PlainTextResponse("ready")
+
+
+@app.get("/models")
+async def list_models() -> Response:
+    models = store.models()
+    return JSONResponse({
+        "default": store.default,
+        "models": [models[name].describe() for name in sorted(models)],
+    })
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def index() -> Response:
     return PlainTextResponse("Post your captcha image to this url.\nExample:\n{\n    \"captcha\": \"/9j/4AAQSkZJRgABAgAAAQABAAD/2wBDAA...\"\n}")
@@ -39,4 +661,9 @@ async def index() -> Response:
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port, reload=False)
+    if processes > 1:
+        from prefork import serve
+        warmup()
+        serve(app, host="0.0.0.0", port=port, workers=processes, after_fork=after_fork)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port, reload=False)
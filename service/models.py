@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+import traceback
+from typing import Callable, Optional
+
+
+class ModelStore:
+    """Serve several models side by side, named after their ``.onnx`` files.
+
+    ``load(path)`` builds (and warms) a model. A new version replaces the old
+    one with a single assignment once it is fully loaded, so requests never
+    see a half-loaded model and those already holding the old one finish on
+    it; ``unload`` is then called with the old model. The unversioned routes
+    use the ``default`` model, or the most recently modified one if not set.
+
+    With ``model_dir``, ``watch`` polls the directory every ``interval``
+    seconds. A file is loaded once its size and mtime stayed the same for one
+    poll, so copies still in progress are skipped; a file that fails to load
+    leaves the previous version serving until it changes again.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[str], object],
+        model_dir: Optional[str] = None,
+        default: Optional[str] = None,
+        interval: float = 2.0,
+        unload: Optional[Callable[[object], None]] = None,
+    ):
+        self.load = load
+        self.model_dir = model_dir
+        self.default_name = default
+        self.interval = interval
+        self.unload = unload
+        self.loads = 0
+        self.failures = 0
+        # (models by name, default name), replaced as a whole so that readers need no lock
+        self._current = ({}, None)
+        self._modified = {}
+        self._versions = {}
+        self._changing = {}
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def get(self, name: Optional[str] = None):
+        models, default = self._current
+        if name is None or name == "default":
+            name = default
+        return models.get(name)
+
+    def models(self) -> dict:
+        return self._current[0]
+
+    @property
+    def default(self) -> Optional[str]:
+        return self._current[1]
+
+    def put(self, name: str, model, modified: int = 0):
+        with self._refresh_lock:
+            self._put(name, model, modified)
+
+    def scan(self) -> dict:
+        files = {}
+        with os.scandir(self.model_dir) as entries:
+            for entry in entries:
+                name, ext = os.path.splitext(entry.name)
+                if ext == ".onnx" and entry.is_file():
+                    stat = entry.stat()
+                    files[name] = (entry.path, (stat.st_mtime_ns, stat.st_size))
+        return files
+
+    def refresh(self, settle: bool = False):
+        """Load new and changed model files and drop deleted ones.
+
+        With ``settle`` a changed file must look the same on two calls in a row.
+        """
+        with self._refresh_lock:
+            files = self.scan()
+            self._changing = {name: version for name, version in self._changing.items() if name in files}
+            for name in list(self._versions):
+                if name not in files:
+                    del self._versions[name]
+                    self._remove(name)
+            for name, (path, version) in sorted(files.items()):
+                if self._versions.get(name) == version:
+                    continue
+                if settle and self._changing.get(name) != version:
+                    self._changing[name] = version
+                    continue
+                self._changing.pop(name, None)
+                # remembered even on failure: retried only once the file changes again
+                self._versions[name] = version
+                self._load(name, path, version[0])
+
+    def watch(self):
+        if self.model_dir is None or self.interval <= 0:
+            return
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh(settle=True)
+            except Exception:
+                print("Scanning the model directory failed:\n" + traceback.format_exc())
+
+    def _load(self, name: str, path: str, modified: int):
+        start = time.perf_counter()
+        try:
+            model = self.load(path)
+        except Exception:
+            self.failures += 1
+            print(f"Loading model {name} from {path} failed:\n" + traceback.format_exc())
+            return
+        self.loads += 1
+        self._put(name, model, modified)
+        print(f"Model {name} loaded from {path} in {time.perf_counter() - start:.2f}s")
+
+    def _put(self, name: str, model, modified: int):
+        models = self._current[0]
+        old = models.get(name)
+        self._modified[name] = modified
+        self._publish({**models, name: model})
+        if old is not None and self.unload is not None:
+            self.unload(old)
+
+    def _remove(self, name: str):
+        models = dict(self._current[0])
+        old = models.pop(name, None)
+        self._modified.pop(name, None)
+        self._publish(models)
+        if old is not None and self.unload is not None:
+            self.unload(old)
+        print(f"Model {name} removed")
+
+    def _publish(self, models: dict):
+        default = self.default_name
+        if default is None and models:
+            default = max(models, key=lambda name: (self._modified[name], name))
+        self._current = (models, default)
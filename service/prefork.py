@@ -0,0 +1,83 @@
+import gc
+import os
+import signal
+import socket
+import traceback
+from typing import Callable, Optional
+
+import uvicorn
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve(
+    app,
+    host: str,
+    port: int,
+    workers: int,
+    after_fork: Optional[Callable[[], None]] = None,
+    **uvicorn_kwargs,
+):
+    """Fork ``workers`` uvicorn processes that share one listening socket.
+
+    Everything loaded before calling this (model, warmed session, imported
+    libraries) is shared copy-on-write with the workers. ``after_fork`` runs in
+    each worker before it starts serving. Workers that die are restarted until
+    the master receives SIGINT or SIGTERM.
+    """
+    sock = bind_socket(host, port)
+    # keep the GC from touching, and thus copying, the pages loaded so far
+    gc.freeze()
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                if after_fork is not None:
+                    after_fork()
+                config = uvicorn.Config(app, **uvicorn_kwargs)
+                uvicorn.Server(config).run(sockets=[sock])
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+    print(f"Serving on {host}:{port} with {workers} worker processes (master pid {os.getpid()})")
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, restarting")
+            spawn()
+    sock.close()
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Awaitable, Hashable, Optional
+
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent identical requests.
+
+    ``start`` runs a coroutine that produces one result per key as a task of
+    its own, so a caller giving up does not cancel the work for the others.
+    While it runs, ``join`` hands out the pending result of any of its keys.
+    A result that is an exception fails only its own key.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._futures = {}
+
+    def join(self, key: Hashable) -> Optional[Awaitable]:
+        future = self._futures.get(key)
+        if future is None:
+            return None
+        self.shared += 1
+        return asyncio.shield(future)
+
+    def start(self, keys: list, coro: Awaitable[list]) -> Awaitable[list]:
+        loop = asyncio.get_running_loop()
+        futures = {key: loop.create_future() for key in keys}
+        self._futures.update(futures)
+        task = loop.create_task(coro)
+
+        def resolve(task: asyncio.Task):
+            for index, (key, future) in enumerate(futures.items()):
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+                if task.cancelled():
+                    future.cancel()
+                elif task.exception() is not None:
+                    future.set_exception(task.exception())
+                    # followers may all have gone away; don't warn about it
+                    future.exception()
+                elif isinstance(task.result()[index], BaseException):
+                    future.set_exception(task.result()[index])
+                    future.exception()
+                else:
+                    future.set_result(task.result()[index])
+
+        task.add_done_callback(resolve)
+        return asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._futures)